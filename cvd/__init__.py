@@ -0,0 +1,5 @@
+"""Cardiovascular disease risk prediction on the CDC BRFSS 2021 extract.
+
+Reusable pieces of the CVD Annotated Notebook live in this package so that
+they can be shared between the notebook and batch jobs.
+"""
@@ -0,0 +1,5 @@
+import sys
+
+from cvd.pipeline import main
+
+sys.exit(main())
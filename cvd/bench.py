@@ -0,0 +1,221 @@
+"""Benchmarks of every pipeline stage on synthetic BRFSS-shaped data.
+
+Each stage of the notebook (load, dedupe, clean, encode, split, scale, PCA,
+a small grid search per model and final scoring) is timed at several row
+counts. Wall time, peak RSS and throughput are appended to a JSON history
+file and compared against a stored baseline; stages slower or bigger than
+the baseline by more than the tolerance are reported as regressions.
+
+Usage:
+    python -m cvd.bench --sizes 100000 1000000 10000000
+    python -m cvd.bench --sizes 100000 --save-baseline
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import xgboost as xgb
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import StandardScaler
+
+from cvd import data, synthetic
+from cvd.dedupe import drop_duplicates
+from cvd.encoding import MODEL_COLUMNS, TARGET, Encoder
+from cvd.pca import PCAStage
+from cvd.search import search
+
+HISTORY = os.path.join('benchmarks', 'history.json')
+BASELINE = os.path.join('benchmarks', 'baseline.json')
+SIZES = [100000, 1000000, 10000000]
+# Changes smaller than these are treated as noise, whatever the tolerance.
+MIN_DELTA = {'wall_s': 0.05, 'peak_rss_mb': 16}
+
+# Four points of each notebook grid, spanning its cheap and expensive ends.
+GRIDS = {
+    'logreg': {'C': [0.01, 100], 'penalty': ['l1', 'l2']},
+    'rf': {'n_estimators': [50], 'max_depth': [5, 15], 'min_samples_split': [2, 5]},
+    'xgb': {'eta': [0.2, 0.4], 'max_depth': [4, 8], 'gamma': [1]},
+}
+
+
+class PeakRss:
+    """Samples the resident set size in a background thread."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _rss(self):
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * self.page_size
+        except OSError:
+            # ru_maxrss is the lifetime peak, in KiB on Linux and bytes on macOS.
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == 'darwin' else peak * 1024
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._rss())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.peak = self._rss()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._rss())
+
+
+def _timed(results, stage, rows, fn, *args, **kwargs):
+    with PeakRss() as rss:
+        start = time.perf_counter()
+        out = fn(*args, **kwargs)
+        wall = time.perf_counter() - start
+    results[stage] = {'wall_s': wall, 'peak_rss_mb': rss.peak / 2 ** 20,
+                      'rows_per_s': rows / wall if wall else None}
+    print(f'  {stage:<12}{wall:>10.3f} s{rss.peak / 2 ** 20:>10.0f} MB{rows / max(wall, 1e-9):>14,.0f} rows/s')
+    return out
+
+
+def _clean(df):
+    df = df.sort_values(by='Age_Category').reset_index(drop=True)
+    return data.clean(df)
+
+
+def _split(X, y):
+    return train_test_split(X, y, test_size=0.2, random_state=42)
+
+
+def _scale(X_train, X_test):
+    scaler = StandardScaler()
+    return scaler.fit_transform(X_train), scaler.transform(X_test)
+
+
+def _pca(X_train, X_test):
+    return PCAStage(10).fit(X_train).project(X_train, X_test)
+
+
+def _final_model(X_train, y_train):
+    return xgb.XGBClassifier(eta=0.2, gamma=1, max_depth=4, random_state=0).fit(X_train, y_train)
+
+
+def run_size(n, workdir, seed=0, models=tuple(GRIDS)):
+    """Benchmark every stage on `n` synthetic rows; returns {stage: metrics}."""
+    results = {}
+    print(f'{n:,} rows')
+    csv_path = os.path.join(workdir, f'synthetic_{n}.csv')
+    if not os.path.exists(csv_path):
+        synthetic.write_csv(csv_path, n, seed=seed)
+
+    df = _timed(results, 'load', n, data.read_csv, csv_path)
+    df = _timed(results, 'dedupe', n, drop_duplicates, df)
+    df = _timed(results, 'clean', len(df), _clean, df)
+    encoder = Encoder(MODEL_COLUMNS)
+    X = _timed(results, 'encode', len(df), encoder.transform, df)
+    y = (df[TARGET] == 'Yes').to_numpy(dtype=np.int8)
+    del df
+    X_train, X_test, y_train, y_test = _timed(results, 'split', len(X), _split, X, y)
+    X_train, X_test = _timed(results, 'scale', len(X), _scale, X_train, X_test)
+    _timed(results, 'pca', len(X), _pca, X_train, X_test)
+    for model in models:
+        points = _timed(results, f'grid_{model}', len(X_train), search, model, GRIDS[model], X_train, y_train,
+                        X_test, y_test, n_jobs=1, verbose=False)
+        results[f'grid_{model}']['points'] = len(points)
+    clf = _final_model(X_train, y_train)
+    _timed(results, 'score', len(X_test), clf.predict_proba, X_test)
+    return results
+
+
+def compare(run, baseline, tolerance):
+    """Return the (size, stage, metric, baseline, current) regressions of `run`."""
+    regressions = []
+    for size, stages in run['results'].items():
+        for stage, metrics in stages.items():
+            base = baseline.get('results', {}).get(size, {}).get(stage)
+            # A grid of another size is not comparable.
+            if base is None or base.get('points') != metrics.get('points'):
+                continue
+            for metric, min_delta in MIN_DELTA.items():
+                before, after = base.get(metric), metrics.get(metric)
+                if before and after and after > before * (1 + tolerance) and after - before > min_delta:
+                    regressions.append((size, stage, metric, before, after))
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+
+def _dump_json(path, obj):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(obj, f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the CVD pipeline stages.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--models', nargs='+', default=list(GRIDS), choices=list(GRIDS))
+    parser.add_argument('--history', default=HISTORY)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown before flagging')
+    parser.add_argument('--workdir', help='where to keep the synthetic CSVs between runs')
+    args = parser.parse_args(argv)
+
+    run = {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'results': {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.workdir or tmp
+        os.makedirs(workdir, exist_ok=True)
+        for n in args.sizes:
+            run['results'][str(n)] = run_size(n, workdir, models=args.models)
+
+    history = _load_json(args.history, [])
+    history.append(run)
+    _dump_json(args.history, history)
+    if args.save_baseline:
+        _dump_json(args.baseline, run)
+        return 0
+
+    regressions = compare(run, _load_json(args.baseline, {}), args.tolerance)
+    for size, stage, metric, base, current in regressions:
+        print(f'REGRESSION {size} rows {stage} {metric}: {base:.3f} -> {current:.3f}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""Reference age statistics from the U.S. Census 2022 population estimates.
+
+The Age_Category encoding needs the mean age of each BRFSS age bin. The
+5-year bins use their midpoints. The open 80+ bin uses the population-weighted
+mean age over 80 from the Census Bureau's "Annual Estimates of the Resident
+Population by Single Year of Age and Sex" (nc-est2022-agesex-res.csv,
+POPESTIMATE2022). That value is embedded below, so the pipeline no longer
+downloads the Census file at startup.
+
+The per-bin population totals used by the age-distribution plot are
+embedded as well, so neither needs the network. The Census file is only
+read to regenerate both, which rewrites the generated block of this module
+in place:
+
+    python -m cvd.census --rebuild
+"""
+import argparse
+import os
+import re
+
+import pandas as pd
+
+CENSUS_URL = 'https://www2.census.gov/programs-surveys/popest/datasets/2020-2022/national/asrh/nc-est2022-agesex-res.csv'
+VERSION = 'nc-est2022-agesex-res POPESTIMATE2022'
+POPULATION_COLUMN = 'POPESTIMATE2022'
+
+AGE_BIN_MIDPOINTS = {'18-24': 21.5, '25-29': 27.5, '30-34': 32.5, '35-39': 37.5, '40-44': 42.5, '45-49': 47.5,
+                     '50-54': 52.5, '55-59': 57.5, '60-64': 62.5, '65-69': 67.5, '70-74': 72.5, '75-79': 77.5}
+
+# BEGIN GENERATED by `python -m cvd.census --rebuild`; edits between the markers are overwritten.
+# Population-weighted mean age of the U.S. population aged 80 and over.
+MEAN_AGE_80PLUS = 85.47505764938691
+# POPESTIMATE2022 (both sexes) per Age_Category bin, and where the values come from.
+AGE_BIN_TOTALS_SOURCE = "rounded to 100,000 from the original notebook's plot"
+AGE_BIN_TOTALS = {'18-24': 31300000, '25-29': 22200000, '30-34': 23300000, '35-39': 22300000, '40-44': 21400000,
+                  '45-49': 19600000, '50-54': 20800000, '55-59': 21000000, '60-64': 21100000, '65-69': 18600000,
+                  '70-74': 15200000, '75-79': 10900000, '80+': 13200000}
+# END GENERATED
+
+# Edges of the BRFSS age bins, with 0-17 in front to be dropped.
+AGE_BINS = [-1, 17, 24, 29, 34, 39, 44, 49, 54, 59, 64, 69, 74, 79, 100]
+
+
+def _single_year_totals(source):
+    census_df = pd.read_csv(source)
+    # SEX == 0 is both sexes combined; AGE == 999 is the all-ages total.
+    return census_df.query('SEX == 0 and AGE < 999')[['AGE', POPULATION_COLUMN]]
+
+
+def mean_age_80plus(census_df):
+    """Population-weighted mean age over 80 from single-year totals."""
+    over_80 = census_df[census_df['AGE'] >= 80]
+    return float((over_80['AGE'] * over_80[POPULATION_COLUMN]).sum() / over_80[POPULATION_COLUMN].sum())
+
+
+def bin_totals_from(census_df):
+    """Sum single-year totals into the BRFSS Age_Category bins."""
+    labels = [f'{low + 1}-{high}' for low, high in zip(AGE_BINS, AGE_BINS[1:])]
+    labels[-1] = '80+'
+    binned = census_df.assign(Age_category=pd.cut(census_df['AGE'], bins=AGE_BINS, labels=labels))
+    totals = binned.groupby('Age_category', observed=False)[[POPULATION_COLUMN]].sum().reset_index()
+    totals['Age_category'] = totals['Age_category'].astype(str)
+    return totals[totals['Age_category'] != '0-17'].reset_index(drop=True)
+
+
+def bin_totals(source=None):
+    """Census population per Age_Category bin, as (Age_category, POPESTIMATE2022) rows.
+
+    The embedded `AGE_BIN_TOTALS` unless a `source` Census file is given.
+    """
+    if source is not None:
+        return bin_totals_from(_single_year_totals(source))
+    return pd.DataFrame({'Age_category': list(AGE_BIN_TOTALS), POPULATION_COLUMN: list(AGE_BIN_TOTALS.values())})
+
+
+def _generated(totals, mean_age, source):
+    """Source lines of the generated block for `totals` (bin -> population) and `mean_age`."""
+    items = [f'{label!r}: {int(total)}' for label, total in totals.items()]
+    lines, line = [], 'AGE_BIN_TOTALS = {'
+    for i, item in enumerate(items):
+        item += '}' if i == len(items) - 1 else ','
+        if len(line) + len(item) + 1 > 120:
+            lines.append(line)
+            line = ' ' * len('AGE_BIN_TOTALS = {') + item
+        else:
+            line += item if line.endswith('{') else ' ' + item
+    lines.append(line)
+    return '\n'.join([
+        '# Population-weighted mean age of the U.S. population aged 80 and over.',
+        f'MEAN_AGE_80PLUS = {mean_age!r}',
+        '# POPESTIMATE2022 (both sexes) per Age_Category bin, and where the values come from.',
+        f'AGE_BIN_TOTALS_SOURCE = {f"{VERSION}, summed from {source}"!r}',
+    ] + lines)
+
+
+def rebuild(source=CENSUS_URL, path=__file__):
+    """Recompute `MEAN_AGE_80PLUS` and `AGE_BIN_TOTALS` from the Census file and rewrite them in `path`."""
+    census_df = _single_year_totals(source)
+    totals = bin_totals_from(census_df)
+    block = _generated(dict(zip(totals['Age_category'], totals[POPULATION_COLUMN])), mean_age_80plus(census_df),
+                       os.path.basename(str(source)))
+    with open(path) as f:
+        code = f.read()
+    pattern = re.compile(r'(# BEGIN GENERATED[^\n]*\n).*?(?=# END GENERATED)', re.DOTALL)
+    if len(pattern.findall(code)) != 1:
+        raise ValueError(f'No generated block in {path}')
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        f.write(pattern.sub(lambda match: match.group(1) + block + '\n', code))
+    os.replace(tmp, path)
+    return block
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Census reference values for the age encoding.')
+    parser.add_argument('--rebuild', action='store_true', help='regenerate the embedded values from the Census file')
+    parser.add_argument('--source', default=CENSUS_URL, help='URL or path of nc-est2022-agesex-res.csv')
+    args = parser.parse_args(argv)
+
+    if args.rebuild:
+        print(rebuild(args.source))
+        print(f'written to {__file__}')
+    else:
+        print(f'{VERSION}: mean age 80+ = {MEAN_AGE_80PLUS}; bin totals {AGE_BIN_TOTALS_SOURCE}')
+
+
+if __name__ == '__main__':
+    main()
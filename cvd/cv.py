@@ -0,0 +1,99 @@
+"""Stratified k-fold cross-validation with shared fold precomputation.
+
+`CVFolds` computes the fold indices and, for every fold, the
+`StandardScaler` (and optionally `PCAStage`) transforms of the training and
+validation parts once. `cross_validate` then reuses them for every model and
+grid point, fitting the (candidate, fold) pairs in parallel.
+"""
+import numpy as np
+
+from cvd.search import ResultCache, fingerprint, fit_and_score
+
+
+def _prepare_fold(X, train_idx, val_idx, n_components):
+    from sklearn.preprocessing import StandardScaler
+
+    scaler = StandardScaler()
+    X_train = scaler.fit_transform(X[train_idx]).astype(np.float32, copy=False)
+    X_val = scaler.transform(X[val_idx]).astype(np.float32, copy=False)
+    fold = {'scaled': (X_train, X_val)}
+    if n_components:
+        from cvd.pca import PCAStage
+        fold['pca'] = PCAStage(n_components).fit(X_train).project(X_train, X_val)
+    return fold
+
+
+class CVFolds:
+    """Stratified k-fold split of (X, y) with per-fold scaled features.
+
+    The scaler (and PCA, when `n_components` is given) is fit on the training
+    part of each fold only, so the validation part stays unseen.
+    """
+
+    def __init__(self, X, y, n_splits=5, seed=42, n_components=None, n_jobs=-1):
+        from joblib import Parallel, delayed
+        from sklearn.model_selection import StratifiedKFold
+
+        X = np.asarray(X)
+        self.y = np.asarray(y)
+        self.n_splits = n_splits
+        self.indices = list(StratifiedKFold(n_splits, shuffle=True, random_state=seed).split(X, self.y))
+        self.folds = Parallel(n_jobs=n_jobs)(
+            delayed(_prepare_fold)(X, train_idx, val_idx, n_components) for train_idx, val_idx in self.indices)
+        self.key = fingerprint(X, self.y) + f'-cv{n_splits}-{seed}-{n_components}'
+
+    def __len__(self):
+        return self.n_splits
+
+    def split(self, i, features='scaled'):
+        """Return (X_train, y_train, X_val, y_val) of fold `i`."""
+        train_idx, val_idx = self.indices[i]
+        X_train, X_val = self.folds[i][features]
+        return X_train, self.y[train_idx], X_val, self.y[val_idx]
+
+
+def cross_validate(model, param_grid, folds, features='scaled', cache_dir=None, n_jobs=-1, train_auc_rows=None,
+                   verbose=True):
+    """Cross-validate every point of `param_grid` for `model` on `folds`.
+
+    `features` is 'scaled' or 'pca'. `train_auc_rows` is passed on to
+    `fit_and_score` to subsample the train AUROC. Returns one dict per
+    candidate, in grid order, with the per-fold and mean validation AUROC.
+    """
+    from joblib import Parallel, delayed
+    from sklearn.model_selection import ParameterGrid
+
+    candidates = list(ParameterGrid(param_grid))
+    data_key = f'{folds.key}-{features}'
+    if train_auc_rows is not None:
+        data_key += f'-train{train_auc_rows}'
+    cache = ResultCache(cache_dir) if cache_dir is not None else None
+
+    results = [cache.get(model, params, data_key, None) if cache is not None else None for params in candidates]
+    todo = [(i, k) for i, result in enumerate(results) if result is None for k in range(len(folds))]
+    fitted = Parallel(n_jobs=n_jobs)(
+        delayed(fit_and_score)(model, candidates[i], *folds.split(k, features), n_threads=1,
+                               train_auc_rows=train_auc_rows)
+        for i, k in todo)
+
+    scores = {}
+    for (i, k), result in zip(todo, fitted):
+        scores.setdefault(i, [None] * len(folds))[k] = result
+    for i, fold_results in scores.items():
+        val_aucs = [r['test_auc'] for r in fold_results]
+        results[i] = {
+            'params': candidates[i],
+            'train_auc': float(np.mean([r['train_auc'] for r in fold_results])),
+            'val_auc': float(np.mean(val_aucs)),
+            'val_auc_std': float(np.std(val_aucs)),
+            'fold_aucs': val_aucs,
+            'fit_time': float(sum(r['fit_time'] for r in fold_results)),
+        }
+        if cache is not None:
+            cache.put(model, candidates[i], data_key, None, results[i])
+
+    if verbose:
+        for result in results:
+            print(f"Hyperparameters: {result['params']}, Train AUROC: {result['train_auc']}, "
+                  f"CV AUROC: {result['val_auc']:.4f} ± {result['val_auc_std']:.4f}")
+    return results
@@ -0,0 +1,183 @@
+"""Loading of the CVD_cleaned.csv dataset.
+
+The CSV is downloaded once, checked against its SHA-256 content hash and
+stored as an uncompressed Feather file with categorical dtypes. Later runs
+memory-map the Feather file instead of downloading and re-parsing the text,
+so they work offline.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import urllib.request
+
+import pandas as pd
+
+GITHUB_URL = 'https://raw.githubusercontent.com/tengxiao-song/CVD/main/CVD_cleaned.csv'
+CACHE_DIR = os.environ.get('CVD_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'cvd'))
+
+# Bump when the cached layout or the dtypes below change.
+CACHE_VERSION = 1
+
+# Columns of CVD_cleaned.csv, in file order.
+COLUMNS = ['General_Health', 'Checkup', 'Exercise', 'Heart_Disease', 'Skin_Cancer', 'Other_Cancer', 'Depression',
+           'Diabetes', 'Arthritis', 'Sex', 'Age_Category', 'Height_(cm)', 'Weight_(kg)', 'BMI', 'Smoking_History',
+           'Alcohol_Consumption', 'Fruit_Consumption', 'Green_Vegetables_Consumption', 'FriedPotato_Consumption']
+YES_NO_COLUMNS = ['Exercise', 'Heart_Disease', 'Skin_Cancer', 'Other_Cancer', 'Depression', 'Arthritis',
+                  'Smoking_History']
+AGE_CATEGORIES = ['18-24', '25-29', '30-34', '35-39', '40-44', '45-49', '50-54', '55-59', '60-64', '65-69',
+                  '70-74', '75-79', '80+']
+DIABETES_CATEGORIES = ['No', 'Yes', 'No, pre-diabetes or borderline diabetes',
+                       'Yes, but female told only during pregnancy']
+
+# Every string column of CVD_cleaned.csv and its levels. Age_Category is
+# ordered so that sorting by it matches sorting the original strings.
+CATEGORIES = {
+    'General_Health': pd.CategoricalDtype(['Poor', 'Fair', 'Good', 'Very Good', 'Excellent'], ordered=True),
+    'Checkup': pd.CategoricalDtype(['Within the past year', 'Within the past 2 years', 'Within the past 5 years',
+                                    '5 or more years ago', 'Never']),
+    'Diabetes': pd.CategoricalDtype(DIABETES_CATEGORIES),
+    'Sex': pd.CategoricalDtype(['Female', 'Male']),
+    'Age_Category': pd.CategoricalDtype(AGE_CATEGORIES, ordered=True),
+}
+CATEGORIES.update({col: pd.CategoricalDtype(['No', 'Yes']) for col in YES_NO_COLUMNS})
+
+
+def _sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _fetch(source, dest):
+    """Copy `source` (a URL or a local path) to `dest`."""
+    if os.path.exists(source):
+        shutil.copyfile(source, dest)
+        return
+    with urllib.request.urlopen(source) as response, open(dest, 'wb') as f:
+        shutil.copyfileobj(response, f)
+
+
+def to_categorical(df):
+    """Cast the string columns of `df` to the declared categorical dtypes.
+
+    Raises ValueError if a column holds a value outside its declared levels,
+    instead of silently turning it into NaN.
+    """
+    df = df.copy()
+    for col, dtype in CATEGORIES.items():
+        if col not in df.columns:
+            continue
+        values = df[col]
+        unknown = set(values.dropna().unique()) - set(dtype.categories)
+        if unknown:
+            raise ValueError(f'Unexpected values in column {col!r}: {sorted(map(str, unknown))}')
+        df[col] = values.astype(dtype)
+    return df
+
+
+def read_csv(path, **kwargs):
+    """Parse a CVD_cleaned.csv-shaped file straight into categorical dtypes."""
+    dtype = {col: 'category' for col in CATEGORIES}
+    dtype.update(kwargs.pop('dtype', {}))
+    return to_categorical(pd.read_csv(path, dtype=dtype, **kwargs))
+
+
+def clean(df):
+    """Apply the notebook's row-independent cleaning steps to `df`.
+
+    Drops General_Health and Checkup, renames the Height and Weight columns
+    and keeps only the plain Yes/No Diabetes answers. Sorting and
+    de-duplication are left to the caller because they need the whole data.
+    """
+    df = df.drop(columns=['General_Health', 'Checkup'], errors='ignore')
+    df = df.rename(columns={'Height_(cm)': 'Height', 'Weight_(kg)': 'Weight'})
+    return df[df['Diabetes'].isin(['Yes', 'No'])]
+
+
+def cache_paths(cache_dir=CACHE_DIR):
+    """Return the (feather, manifest) paths of the cached dataset."""
+    return (os.path.join(cache_dir, 'CVD_cleaned.feather'),
+            os.path.join(cache_dir, 'CVD_cleaned.json'))
+
+
+def build_cache(source=GITHUB_URL, cache_dir=CACHE_DIR, sha256=None):
+    """Download `source`, verify it and write the Feather cache.
+
+    Returns the manifest describing the cached file.
+    """
+    feather_path, manifest_path = cache_paths(cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=cache_dir) as tmp:
+        csv_path = os.path.join(tmp, 'CVD_cleaned.csv')
+        _fetch(source, csv_path)
+        digest = _sha256(csv_path)
+        if sha256 is not None and digest != sha256:
+            raise ValueError(f'SHA-256 mismatch for {source}: expected {sha256}, got {digest}')
+        df = read_csv(csv_path)
+
+        # Write to a temporary name first so that an interrupted run never
+        # leaves a truncated cache behind.
+        tmp_feather = os.path.join(tmp, 'CVD_cleaned.feather')
+        df.to_feather(tmp_feather, compression='uncompressed')
+        os.replace(tmp_feather, feather_path)
+
+    manifest = {'version': CACHE_VERSION, 'source': source, 'sha256': digest, 'rows': len(df)}
+    if os.path.exists(source):
+        manifest['stat'] = _stat(source)
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def _stat(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def is_stale(manifest, source, sha256=None):
+    """Whether the cache described by `manifest` is missing or does not hold `source`.
+
+    A local `source` is re-hashed only when its size or modification time
+    differs from the cached copy's.
+    """
+    if manifest is None or manifest['source'] != source:
+        return True
+    if sha256 is not None and manifest['sha256'] != sha256:
+        return True
+    if os.path.exists(source) and manifest.get('stat') != _stat(source):
+        return _sha256(source) != manifest['sha256']
+    return False
+
+
+def read_manifest(cache_dir=CACHE_DIR):
+    """Return the manifest of the cached dataset, or None if there is no usable cache."""
+    feather_path, manifest_path = cache_paths(cache_dir)
+    if not (os.path.exists(feather_path) and os.path.exists(manifest_path)):
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != CACHE_VERSION:
+        return None
+    return manifest
+
+
+def load_cvd(source=GITHUB_URL, cache_dir=CACHE_DIR, sha256=None, refresh=False):
+    """Load CVD_cleaned.csv as a DataFrame with categorical string columns.
+
+    The first call downloads `source` and caches it under `cache_dir`; later
+    calls memory-map the cache and never touch the network. The cache is
+    rebuilt when it holds another source or a local source file has
+    changed. Pass `sha256` to pin the expected content hash of the CSV, and
+    `refresh=True` to force a new download.
+    """
+    import pyarrow.feather as feather
+
+    manifest = None if refresh else read_manifest(cache_dir)
+    if is_stale(manifest, source, sha256):
+        build_cache(source, cache_dir, sha256)
+    feather_path, _ = cache_paths(cache_dir)
+    return feather.read_table(feather_path, memory_map=True).to_pandas()
@@ -0,0 +1,159 @@
+"""Hash-based, streaming de-duplication of survey rows.
+
+`DataFrame.drop_duplicates` compares whole rows, including the string
+columns, and only sees the rows of one frame. `Deduplicator` instead
+reduces every row to a 64-bit hash after normalizing its types:
+
+- the declared categorical columns (`cvd.data.CATEGORIES`) are hashed by
+  their code under the declared levels, so 'Yes' read as a string, an
+  object or a category with another level order hashes the same;
+- numeric columns are hashed as float64, so 25 and 25.0 match, with one
+  NaN and one zero;
+- columns are taken in name order, so files with reordered columns match.
+
+The hashes seen so far are kept as one sorted uint64 array (8 bytes per
+unique row, whatever the width of the text), and each chunk is checked
+against it with a binary search. With a `path`, the set and the per-source
+counts are saved there, so later chunks, files and survey years are
+de-duplicated against everything ingested before. Two different rows share
+a hash with probability about n^2 / 2^65, below 1e-7 for a million unique
+rows.
+
+Usage:
+    python -m cvd.dedupe brfss_2021.csv brfss_2022.csv --state dedupe/ --output deduplicated.csv
+"""
+import argparse
+import glob
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from cvd import data
+
+HASH_FILE = 'hashes.npy'
+SOURCES_FILE = 'sources.json'
+
+
+def _normalized(df):
+    """Columns of `df` in name order, as integer codes (categoricals), float64 (numbers) or strings."""
+    columns = {}
+    for col in sorted(df.columns):
+        values = df[col]
+        if col in data.CATEGORIES:
+            if values.dtype != data.CATEGORIES[col]:
+                values = data.to_categorical(df[[col]])[col]
+            columns[col] = values.cat.codes.to_numpy(dtype=np.int64)
+        elif pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+            values = values.to_numpy(dtype=np.float64) + 0.0  # -0.0 -> 0.0
+            values[np.isnan(values)] = np.nan  # one NaN bit pattern
+            columns[col] = values
+        else:
+            columns[col] = values.astype(str).str.strip().to_numpy(dtype=object)
+    return pd.DataFrame(columns, index=df.index)
+
+
+def row_hashes(df):
+    """uint64 hash of every row of `df` after type normalization."""
+    return pd.util.hash_pandas_object(_normalized(df), index=False).to_numpy()
+
+
+class Deduplicator:
+    """Set of the row hashes seen so far, optionally persisted in directory `path`.
+
+    `sources` counts, per source, the rows read, the duplicates removed and
+    the rows kept.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.sources = {}
+        if path is not None and os.path.exists(os.path.join(path, HASH_FILE)):
+            self.hashes = np.load(os.path.join(path, HASH_FILE))
+            with open(os.path.join(path, SOURCES_FILE)) as f:
+                self.sources = json.load(f)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def _seen(self, hashes):
+        if not len(self.hashes):
+            return np.zeros(len(hashes), dtype=bool)
+        pos = np.minimum(np.searchsorted(self.hashes, hashes), len(self.hashes) - 1)
+        return self.hashes[pos] == hashes
+
+    def duplicated(self, df):
+        """Boolean mask of the rows of `df` already seen or repeating an earlier row of `df`; does not record."""
+        hashes = row_hashes(df)
+        first = np.zeros(len(hashes), dtype=bool)
+        first[np.unique(hashes, return_index=True)[1]] = True
+        return ~first | self._seen(hashes)
+
+    def filter(self, df, source=None):
+        """Rows of `df` not seen before, in their original order; records them and counts them under `source`."""
+        hashes = row_hashes(df)
+        unique, first = np.unique(hashes, return_index=True)
+        new = ~self._seen(unique)
+        keep = np.zeros(len(hashes), dtype=bool)
+        keep[first[new]] = True
+        # Both runs are sorted, so the stable sort only merges them.
+        self.hashes = np.sort(np.concatenate([self.hashes, unique[new]]), kind='stable')
+        counts = self.sources.setdefault(str(source), {'rows': 0, 'duplicates': 0, 'kept': 0})
+        counts['rows'] += len(df)
+        counts['kept'] += int(keep.sum())
+        counts['duplicates'] = counts['rows'] - counts['kept']
+        return df[keep]
+
+    def stream(self, paths, chunksize=100000):
+        """Yield (path, de-duplicated chunk) for CSV files shaped like CVD_cleaned.csv, in order."""
+        dtype = {col: 'category' for col in data.CATEGORIES}
+        for path in paths:
+            for chunk in pd.read_csv(path, dtype=dtype, chunksize=chunksize):
+                yield path, self.filter(data.to_categorical(chunk), path)
+
+    def save(self):
+        """Write the hash set and the counts to `path`, atomically."""
+        os.makedirs(self.path, exist_ok=True)
+        hash_path, sources_path = os.path.join(self.path, HASH_FILE), os.path.join(self.path, SOURCES_FILE)
+        tmp = f'{hash_path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            np.save(f, self.hashes)
+        os.replace(tmp, hash_path)
+        tmp = f'{sources_path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.sources, f, indent=2)
+        os.replace(tmp, sources_path)
+
+
+def drop_duplicates(df):
+    """`df.drop_duplicates()` by row hash: keeps the first occurrence of every row."""
+    return Deduplicator().filter(df)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='De-duplicate survey CSVs against each other and earlier runs.')
+    parser.add_argument('paths', nargs='+', help='CSV files (globs allowed) shaped like CVD_cleaned.csv')
+    parser.add_argument('--state', help='directory of the persistent hash set (default: in memory only)')
+    parser.add_argument('--output', help='CSV to write the kept rows to')
+    parser.add_argument('--chunksize', type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    paths = [path for pattern in args.paths for path in sorted(glob.glob(pattern)) or [pattern]]
+    dedupe = Deduplicator(args.state)
+    header = True
+    for _, chunk in dedupe.stream(paths, args.chunksize):
+        if args.output:
+            chunk.to_csv(args.output, mode='w' if header else 'a', header=header, index=False)
+            header = False
+    if args.state:
+        dedupe.save()
+    print(f"{'source':<40}{'rows':>12}{'duplicates':>12}{'kept':>12}")
+    for source, counts in dedupe.sources.items():
+        print(f"{source:<40}{counts['rows']:>12,}{counts['duplicates']:>12,}{counts['kept']:>12,}")
+    print(f'{len(dedupe):,} unique rows in the set')
+
+
+if __name__ == '__main__':
+    main()
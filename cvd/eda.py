@@ -0,0 +1,207 @@
+"""Mergeable summary statistics for the exploratory data analysis.
+
+`Summary` scans cleaned survey rows once and keeps only sufficient
+statistics:
+
+- the row count, means and centered co-moment matrix of the encoded
+  features, from which every correlation matrix of the notebook is derived;
+- the level counts of every categorical column;
+- the counts of every numeric column at a fixed resolution, from which
+  histograms with any binning are derived.
+
+Summaries of separate chunks or files combine with `merge` (pairwise
+update of the co-moments, so no precision is lost to large sums). A
+multi-million-row dataset is therefore summarized chunk by chunk in one
+pass, and a new survey wave is added without rescanning the old rows. The
+result is saved as a small JSON file.
+
+Usage:
+    python -m cvd.eda brfss_*.csv --output eda.json
+    python -m cvd.eda brfss_2023.csv --update eda.json
+"""
+import argparse
+import glob
+import json
+
+import numpy as np
+import pandas as pd
+
+from cvd import data
+from cvd.encoding import SCHEMA, Encoder
+
+SUMMARY_VERSION = 1
+# Numeric values are counted after rounding to this resolution. All columns
+# of the extract are integers except BMI and Weight (two decimals).
+RESOLUTION = 0.1
+
+
+class Summary:
+    """Sufficient statistics of cleaned survey rows; see the module docstring."""
+
+    def __init__(self, columns, resolution=RESOLUTION):
+        self.encoder = Encoder(columns)
+        self.resolution = resolution
+        d = len(self.encoder.columns)
+        self.n = 0
+        self.mean = np.zeros(d)
+        self.m2 = np.zeros((d, d))
+        self.counts = {}
+        self.values = {}
+
+    @classmethod
+    def from_frame(cls, df, resolution=RESOLUTION):
+        return cls([col for col in SCHEMA if col in df.columns], resolution).update(df)
+
+    @property
+    def feature_names(self):
+        return self.encoder.feature_names
+
+    def _merge_moments(self, n, mean, m2):
+        total = self.n + n
+        delta = mean - self.mean
+        self.m2 = self.m2 + m2 + np.outer(delta, delta) * (self.n * n / total)
+        self.mean = self.mean + delta * (n / total)
+        self.n = total
+
+    def update(self, df):
+        """Add the rows of the cleaned DataFrame `df`; returns self."""
+        if not len(df):
+            return self
+        X = self.encoder.transform(df).astype(np.float64)
+        mean = X.mean(axis=0)
+        X -= mean
+        self._merge_moments(len(X), mean, X.T @ X)
+
+        for col in df.columns:
+            values = df[col]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                counts = pd.Series(np.bincount(values.cat.codes[values.cat.codes >= 0],
+                                               minlength=len(values.cat.categories)),
+                                   index=values.cat.categories.astype(str))
+                self.counts[col] = self.counts[col].add(counts, fill_value=0) if col in self.counts else counts
+            elif pd.api.types.is_numeric_dtype(values):
+                values = values.to_numpy(dtype=np.float64)
+                # Missing values are not counted; cast to int64 they would become arbitrary keys.
+                values = values[~np.isnan(values)]
+                keys, counts = np.unique(np.round(values / self.resolution).astype(np.int64), return_counts=True)
+                counts = pd.Series(counts, index=keys)
+                self.values[col] = self.values[col].add(counts, fill_value=0) if col in self.values else counts
+            else:
+                counts = values.value_counts()
+                self.counts[col] = self.counts[col].add(counts, fill_value=0) if col in self.counts else counts
+        return self
+
+    def merge(self, other):
+        """Combine with the summary of other rows; returns self."""
+        if other.encoder.columns != self.encoder.columns or other.resolution != self.resolution:
+            raise ValueError('Summaries of different columns or resolutions cannot be merged')
+        if other.n:
+            self._merge_moments(other.n, other.mean, other.m2)
+        for mine, theirs in ((self.counts, other.counts), (self.values, other.values)):
+            for col, counts in theirs.items():
+                mine[col] = mine[col].add(counts, fill_value=0) if col in mine else counts
+        return self
+
+    def cov(self, columns=None):
+        """Sample covariance matrix of the encoded features (by feature name)."""
+        cov = pd.DataFrame(self.m2 / max(self.n - 1, 1), index=self.feature_names, columns=self.feature_names)
+        return cov if columns is None else cov.loc[columns, columns]
+
+    def corr(self, columns=None):
+        """Pearson correlation matrix, equal to `DataFrame.corr()` of the encoded rows."""
+        cov = self.cov(columns)
+        std = np.sqrt(np.diag(cov.to_numpy()))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return cov / np.outer(std, std)
+
+    def value_counts(self, col, normalize=False):
+        """Counts of the levels of a categorical column, or of the rounded values of a numeric one."""
+        if col in self.counts:
+            counts = self.counts[col].astype(np.int64)
+        else:
+            counts = self.values[col].astype(np.int64).sort_index()
+            counts.index = np.round(counts.index.to_numpy() * self.resolution, 10)
+        counts.name = col
+        return counts / counts.sum() if normalize else counts
+
+    def histogram(self, col, bins=50):
+        """(counts, edges) of a numeric column, as `np.histogram` would return."""
+        counts = self.value_counts(col)
+        return np.histogram(counts.index.to_numpy(), bins=bins, weights=counts.to_numpy())
+
+    def to_dict(self):
+        return {
+            'version': SUMMARY_VERSION,
+            'columns': self.encoder.columns,
+            'resolution': self.resolution,
+            'n': self.n,
+            'mean': self.mean.tolist(),
+            'm2': self.m2.tolist(),
+            'counts': {col: {str(k): int(v) for k, v in counts.items()} for col, counts in self.counts.items()},
+            'values': {col: [counts.index.tolist(), counts.astype(np.int64).tolist()]
+                       for col, counts in self.values.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        if d.get('version') != SUMMARY_VERSION:
+            raise ValueError(f'Unsupported summary version {d.get("version")}')
+        summary = cls(d['columns'], d['resolution'])
+        summary.n = d['n']
+        summary.mean = np.asarray(d['mean'])
+        summary.m2 = np.asarray(d['m2'])
+        summary.counts = {col: pd.Series(counts, dtype=np.int64) for col, counts in d['counts'].items()}
+        summary.values = {col: pd.Series(counts, index=keys, dtype=np.int64)
+                          for col, (keys, counts) in d['values'].items()}
+        return summary
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+def summarize(paths, chunksize=200000, resolution=RESOLUTION):
+    """Summarize cleaned rows of CSV files shaped like CVD_cleaned.csv, chunk by chunk.
+
+    Rows are not de-duplicated. Without any rows, the summary is empty (`n == 0`).
+    """
+    summary = None
+    for path in paths:
+        dtype = {col: 'category' for col in data.CATEGORIES}
+        for chunk in pd.read_csv(path, dtype=dtype, chunksize=chunksize):
+            chunk = data.clean(data.to_categorical(chunk))
+            if summary is None:
+                summary = Summary.from_frame(chunk, resolution)
+            else:
+                summary.update(chunk)
+    if summary is None:
+        summary = Summary.from_frame(data.clean(data.to_categorical(pd.DataFrame(columns=data.COLUMNS))), resolution)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Summarize survey CSVs for the exploratory data analysis.')
+    parser.add_argument('paths', nargs='+', help='CSV files (globs allowed) shaped like CVD_cleaned.csv')
+    parser.add_argument('--output', help='where to save the summary')
+    parser.add_argument('--update', help='existing summary to add the rows to (and save back)')
+    parser.add_argument('--chunksize', type=int, default=200000)
+    args = parser.parse_args(argv)
+
+    paths = [path for pattern in args.paths for path in sorted(glob.glob(pattern)) or [pattern]]
+    summary = summarize(paths, args.chunksize)
+    if args.update:
+        summary = Summary.load(args.update).merge(summary)
+    output = args.output or args.update
+    if output:
+        summary.save(output)
+    print(f'{summary.n:,} rows')
+    print(summary.corr().round(2).to_string())
+
+
+if __name__ == '__main__':
+    main()
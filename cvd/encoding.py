@@ -0,0 +1,101 @@
+"""Vectorized encoding of the cleaned CVD data into a numeric feature matrix.
+
+The column -> mapping schema is declared once in `SCHEMA`. `Encoder` maps
+each categorical column through a NumPy lookup table indexed by its
+categorical codes, and writes every column straight into a preallocated
+float32 matrix.
+"""
+import numpy as np
+import pandas as pd
+
+from cvd.census import AGE_BIN_MIDPOINTS, MEAN_AGE_80PLUS
+
+# Mean age of each 5-year bin. The value for 80+ is the population-weighted
+# mean age of the U.S. population over 80 (Census 2022 estimate).
+AGE_ENCODE_DICT = dict(AGE_BIN_MIDPOINTS, **{'80+': round(MEAN_AGE_80PLUS, 1)})
+YES_NO = {'No': 0, 'Yes': 1}
+
+# Input column -> mapping, in output order. None means the column is numeric
+# and copied as is; encoded columns get an `_Encoded` suffix.
+SCHEMA = {
+    'Height': None,
+    'Weight': None,
+    'BMI': None,
+    'Alcohol_Consumption': None,
+    'Fruit_Consumption': None,
+    'Green_Vegetables_Consumption': None,
+    'FriedPotato_Consumption': None,
+    'Exercise': YES_NO,
+    'Heart_Disease': YES_NO,
+    'Skin_Cancer': YES_NO,
+    'Other_Cancer': YES_NO,
+    'Depression': YES_NO,
+    'Diabetes': YES_NO,
+    'Arthritis': YES_NO,
+    'Smoking_History': YES_NO,
+    'Sex': {'Male': 0, 'Female': 1},
+    'Age_Category': AGE_ENCODE_DICT,
+}
+
+TARGET = 'Heart_Disease'
+# Height and Weight are left out of the models because of their correlation
+# with BMI and Sex.
+MODEL_COLUMNS = [col for col in SCHEMA if col not in ('Height', 'Weight', TARGET)]
+
+
+def _codes(values, categories):
+    """Return integer codes of `values` against `categories`, -1 if missing."""
+    if isinstance(values.dtype, pd.CategoricalDtype) and list(values.cat.categories) == categories:
+        return values.cat.codes.to_numpy()
+    return pd.Categorical(values, categories=categories).codes
+
+
+class Encoder:
+    """Encodes DataFrame columns into a float32 matrix according to `SCHEMA`.
+
+    `columns` selects and orders the input columns to encode; by default
+    every column of the schema is encoded.
+    """
+
+    def __init__(self, columns=None, schema=SCHEMA):
+        self.schema = schema
+        self.columns = list(schema if columns is None else columns)
+        self.tables = {}
+        for col in self.columns:
+            mapping = schema[col]
+            if mapping is not None:
+                self.tables[col] = (list(mapping), np.asarray(list(mapping.values()), dtype=np.float32))
+
+    @property
+    def feature_names(self):
+        return [col if self.schema[col] is None else col + '_Encoded' for col in self.columns]
+
+    def transform(self, df, out=None):
+        """Encode `df` into `out`, a preallocated (len(df), n_features) array.
+
+        A float32 matrix is allocated when `out` is None. Raises ValueError
+        if a categorical column holds a value missing from its mapping.
+        """
+        if out is None:
+            out = np.empty((len(df), len(self.columns)), dtype=np.float32)
+        elif out.shape != (len(df), len(self.columns)):
+            raise ValueError(f'out has shape {out.shape}, expected {(len(df), len(self.columns))}')
+        for j, col in enumerate(self.columns):
+            values = df[col]
+            if col not in self.tables:
+                out[:, j] = values.to_numpy()
+                continue
+            categories, table = self.tables[col]
+            codes = _codes(values, categories)
+            if (codes < 0).any():
+                unknown = pd.unique(values[codes < 0].astype(object))
+                raise ValueError(f'Cannot encode values of column {col!r}: {list(unknown)}')
+            out[:, j] = table[codes]
+        return out
+
+    def to_frame(self, matrix, index=None):
+        """Wrap an encoded matrix in a DataFrame without copying it."""
+        return pd.DataFrame(matrix, columns=self.feature_names, index=index, copy=False)
+
+    def transform_frame(self, df):
+        return self.to_frame(self.transform(df), index=df.index)
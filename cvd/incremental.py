@@ -0,0 +1,224 @@
+"""Incremental refresh of an exported risk model with a new survey wave.
+
+`IncrementalModel` loads an artifact written by `cvd.serve.export_model`
+and updates it from the new rows only, so a refresh costs time in
+proportion to the wave rather than to the full history:
+
+- the running `StandardScaler` statistics are updated with `partial_fit`,
+  and so is the basis of an `IncrementalPCA`, when the artifact has one;
+- an `XGBClassifier` keeps boosting from the saved booster;
+- a saga `LogisticRegression` is warm-started, and an `SGDClassifier` is
+  updated with `partial_fit`.
+
+Linear models move onto the refreshed scaler (and PCA): their
+coefficients are first rewritten for the new preprocessing, then trained
+further. Trees split on thresholds in the units they were trained with,
+and standardizing does not change what a tree can learn, so boosted
+models keep the preprocessing they were trained on. The refreshed
+statistics are still saved alongside and reported.
+
+Each wave is split into update and holdout rows. The drift report
+compares the holdout AUROC of the stored model with the reference AUROC
+of the previous wave, before and after the update, and gives the shift
+of every feature mean in standard deviations.
+
+Usage:
+    python -m cvd.incremental models/cvd_xgb.joblib brfss_2023.csv --rounds 20
+    python -m cvd.incremental models/cvd_xgb.joblib brfss_2023.csv --reference-auc 0.83 --output models/cvd_2023.joblib
+"""
+import argparse
+import copy
+import json
+import sys
+import time
+
+import numpy as np
+
+from cvd import data
+from cvd.encoding import TARGET
+from cvd.metrics import auroc
+from cvd.serve import ARTIFACT_VERSION, RiskModel, export_model
+
+
+def _linear_to_raw(coef, intercept, scaler, pca):
+    """Rewrite logit = coef . f(x) + intercept as a . x + c on encoded features x."""
+    a, c = coef, intercept
+    if pca is not None:
+        a = coef @ pca.components_
+        c = intercept - a @ pca.mean_
+    if scaler is not None:
+        a = a / scaler.scale_
+        c = c - a @ scaler.mean_
+    return a, c
+
+
+def _linear_from_raw(a, c, scaler, pca):
+    """Inverse of `_linear_to_raw`; projects onto the PCA basis when there is one."""
+    if scaler is not None:
+        c = c + a @ scaler.mean_
+        a = a * scaler.scale_
+    if pca is not None:
+        c = c + a @ pca.mean_
+        a = a @ pca.components_.T
+    return a, c
+
+
+def _pca_overlap(before, after):
+    """Mean squared cosine between two PCA bases; 1 means the same subspace."""
+    return float(np.sum((before.components_ @ after.components_.T) ** 2) / len(before.components_))
+
+
+class IncrementalModel(RiskModel):
+    """A `RiskModel` that can be refreshed with new survey waves.
+
+    `running_scaler` and `running_pca` hold the preprocessing statistics over
+    every row seen so far; `waves` holds one drift report per update.
+    """
+
+    def __init__(self, encoder, scaler, model, pca=None, running_scaler=None, running_pca=None, waves=None,
+                 reference_auc=None):
+        super().__init__(encoder, scaler, model, pca)
+        if pca is not None and not hasattr(pca, 'partial_fit'):
+            raise ValueError(f'{type(pca).__name__} cannot be updated incrementally; refit with IncrementalPCA')
+        self.running_scaler = running_scaler if running_scaler is not None else copy.deepcopy(scaler)
+        self.running_pca = running_pca if running_pca is not None else copy.deepcopy(pca)
+        self.waves = list(waves or [])
+        self.reference_auc = reference_auc
+
+    @property
+    def is_linear(self):
+        return hasattr(self.model, 'coef_')
+
+    @classmethod
+    def load(cls, path):
+        import joblib
+
+        artifact = joblib.load(path)
+        if artifact.get('version') != ARTIFACT_VERSION:
+            raise ValueError(f'Unsupported artifact version {artifact.get("version")} in {path}')
+        return cls(artifact['encoder'], artifact['scaler'], artifact['model'], artifact.get('pca'),
+                   artifact.get('running_scaler'), artifact.get('running_pca'), artifact.get('waves'),
+                   artifact.get('reference_auc'))
+
+    def save(self, path):
+        export_model(path, self.encoder, self.scaler, self.model, pca=self.pca,
+                     running_scaler=self.running_scaler, running_pca=self.running_pca, waves=self.waves,
+                     reference_auc=self.reference_auc)
+
+    def _score(self, X):
+        return self.model.predict_proba(self.features(X))[:, 1]
+
+    def _refresh_preprocessing(self, X):
+        # Same input type as `features`, so neither kind of scaler warns about feature names.
+        if self.running_scaler is None or hasattr(self.running_scaler, 'feature_names_in_'):
+            X = self.encoder.to_frame(X)
+        else:
+            X = np.asarray(X)
+        if self.running_scaler is not None:
+            self.running_scaler.partial_fit(X)
+        if self.running_pca is not None:
+            Z = self.running_scaler.transform(X) if self.running_scaler is not None else X
+            self.running_pca.partial_fit(Z)
+
+    def _update_linear(self, X, y, max_iter):
+        a, c = _linear_to_raw(self.model.coef_[0], self.model.intercept_[0], self.scaler, self.pca)
+        self.scaler = copy.deepcopy(self.running_scaler)
+        self.pca = copy.deepcopy(self.running_pca)
+        coef, intercept = _linear_from_raw(a, c, self.scaler, self.pca)
+        self.model.coef_ = coef[None, :].astype(self.model.coef_.dtype)
+        self.model.intercept_ = np.array([intercept], dtype=self.model.intercept_.dtype)
+        if hasattr(self.model, 'partial_fit'):
+            self.model.partial_fit(self.features(X), y)
+        else:
+            previous = self.model.get_params()
+            self.model.set_params(warm_start=True, max_iter=max_iter)
+            self.model.fit(self.features(X), y)
+            self.model.set_params(warm_start=previous['warm_start'], max_iter=previous['max_iter'])
+
+    def _update_boosted(self, X, y, rounds):
+        n_estimators = self.model.get_params()['n_estimators']
+        self.model.set_params(n_estimators=rounds)
+        self.model.fit(self.features(X), y, xgb_model=self.model.get_booster())
+        self.model.set_params(n_estimators=n_estimators)
+
+    def update(self, df, rounds=20, max_iter=20, holdout=0.2, seed=0, tolerance=0.01):
+        """Refresh the model with the rows of `df` and return the wave's drift report.
+
+        `df` holds raw survey rows shaped like CVD_cleaned.csv. `rounds` is the
+        number of trees added to a boosted model, `max_iter` the number of saga
+        epochs of a logistic regression. A `holdout` fraction of the wave is
+        kept out of the update to measure the AUROC before and after it; the
+        wave is flagged as drifted when that AUROC is more than `tolerance`
+        below the reference.
+        """
+        start = time.perf_counter()
+        n_rows = len(df)
+        df = df.drop_duplicates()
+        n_duplicates = n_rows - len(df)
+        df = data.clean(df)
+        X = self.encoder.transform(df)
+        y = (df[TARGET] == 'Yes').to_numpy(dtype=np.int8)
+        is_holdout = np.random.default_rng(seed).random(len(X)) < holdout
+        X_update, y_update = X[~is_holdout], y[~is_holdout]
+        X_holdout, y_holdout = X[is_holdout], y[is_holdout]
+
+        feature_shift = {}
+        if self.running_scaler is not None:
+            shift = (X_update.mean(axis=0) - self.running_scaler.mean_) / self.running_scaler.scale_
+            feature_shift = dict(zip(self.encoder.feature_names, shift.round(4).tolist()))
+        before_auc = auroc(y_holdout, self._score(X_holdout))
+        previous_pca = copy.deepcopy(self.running_pca)
+
+        self._refresh_preprocessing(X_update)
+        if self.is_linear:
+            self._update_linear(X_update, y_update, max_iter)
+        elif hasattr(self.model, 'get_booster'):
+            self._update_boosted(X_update, y_update, rounds)
+        else:
+            raise ValueError(f'{type(self.model).__name__} cannot be updated incrementally')
+        after_auc = auroc(y_holdout, self._score(X_holdout))
+
+        report = {
+            'wave': len(self.waves) + 1,
+            'rows': n_rows,
+            'duplicates': n_duplicates,
+            'update_rows': int(len(X_update)),
+            'holdout_rows': int(len(X_holdout)),
+            'reference_auc': self.reference_auc,
+            'before_auc': before_auc,
+            'after_auc': after_auc,
+            'drifted': self.reference_auc is not None and before_auc < self.reference_auc - tolerance,
+            'feature_shift': feature_shift,
+            'pca_overlap': _pca_overlap(previous_pca, self.running_pca) if previous_pca is not None else None,
+            'rows_seen': int(self.running_scaler.n_samples_seen_) if self.running_scaler is not None else None,
+            'fit_time': time.perf_counter() - start,
+        }
+        self.waves.append(report)
+        self.reference_auc = after_auc
+        return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Refresh an exported CVD risk model with a new survey wave.')
+    parser.add_argument('artifact', help='model artifact written by export_model')
+    parser.add_argument('wave', help='CSV of new survey rows shaped like CVD_cleaned.csv')
+    parser.add_argument('--output', help='where to save the refreshed artifact (default: overwrite)')
+    parser.add_argument('--rounds', type=int, default=20, help='trees added to a boosted model')
+    parser.add_argument('--max-iter', type=int, default=20, help='saga epochs of a logistic regression')
+    parser.add_argument('--holdout', type=float, default=0.2)
+    parser.add_argument('--reference-auc', type=float, help='AUROC of the stored model, if not recorded yet')
+    parser.add_argument('--tolerance', type=float, default=0.01, help='AUROC drop flagged as drift')
+    args = parser.parse_args(argv)
+
+    model = IncrementalModel.load(args.artifact)
+    if args.reference_auc is not None:
+        model.reference_auc = args.reference_auc
+    report = model.update(data.read_csv(args.wave), args.rounds, args.max_iter, args.holdout,
+                          tolerance=args.tolerance)
+    model.save(args.output or args.artifact)
+    print(json.dumps(report, indent=2))
+    return 1 if report['drifted'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
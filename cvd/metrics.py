@@ -0,0 +1,100 @@
+"""Binary classification metrics from a single sort of the scores.
+
+`evaluate` sorts the scores once and derives, in vectorized passes over the
+sorted labels, the exact AUROC, the average precision, the ROC curve and the
+confusion matrix with its derived rates at any number of thresholds. `auroc`
+is the AUROC alone, optionally on a random subsample for cheap training-set
+estimates, and `average_precision` the area under the precision-recall curve.
+"""
+import numpy as np
+
+
+def _sorted_counts(y_true, scores):
+    """Sort by descending score; return the sorted scores and cumulative positives."""
+    y_true = np.asarray(y_true)
+    scores = np.asarray(scores)
+    order = np.argsort(-scores, kind='mergesort')
+    return scores[order], np.cumsum(y_true[order] == 1)
+
+
+def _roc(sorted_scores, cum_pos):
+    # Last index of every run of tied scores.
+    idx = np.r_[np.flatnonzero(np.diff(sorted_scores)), len(sorted_scores) - 1]
+    tps = cum_pos[idx]
+    fps = idx + 1 - tps
+    tpr = np.r_[0, tps] / max(tps[-1], 1)
+    fpr = np.r_[0, fps] / max(fps[-1], 1)
+    thresholds = np.r_[np.inf, sorted_scores[idx]]
+    return fpr, tpr, thresholds
+
+
+def _average_precision(sorted_scores, cum_pos):
+    # Precision at each run of tied scores, weighted by the recall it adds, as in scikit-learn.
+    idx = np.r_[np.flatnonzero(np.diff(sorted_scores)), len(sorted_scores) - 1]
+    tps = cum_pos[idx]
+    if not len(tps) or tps[-1] == 0:
+        return 0.0
+    recall = np.r_[0, tps] / tps[-1]
+    return float(np.sum(np.diff(recall) * tps / (idx + 1)))
+
+
+def _trapezoid(fpr, tpr):
+    return float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+
+
+def auroc(y_true, scores, max_rows=None, seed=0):
+    """Exact AUROC, or the AUROC of `max_rows` randomly chosen rows."""
+    y_true = np.asarray(y_true)
+    scores = np.asarray(scores)
+    if max_rows is not None and len(y_true) > max_rows:
+        rows = np.random.default_rng(seed).choice(len(y_true), max_rows, replace=False)
+        y_true, scores = y_true[rows], scores[rows]
+    return _trapezoid(*_roc(*_sorted_counts(y_true, scores))[:2])
+
+
+def average_precision(y_true, scores):
+    """Average precision (area under the precision-recall curve, step-wise)."""
+    return _average_precision(*_sorted_counts(y_true, scores))
+
+
+def evaluate(y_true, scores, thresholds=(0.5,)):
+    """AUROC, ROC curve and per-threshold confusion matrices from one sort.
+
+    A row is predicted positive when its score is above the threshold, which
+    matches `predict` of probabilistic classifiers at 0.5. Returns a dict with
+    'auc', 'average_precision', 'fpr', 'tpr', 'roc_thresholds' and 'at', a
+    list with one dict of counts (tn, fp, fn, tp) and rates per threshold.
+    """
+    sorted_scores, cum_pos = _sorted_counts(y_true, scores)
+    fpr, tpr, roc_thresholds = _roc(sorted_scores, cum_pos)
+    n = len(sorted_scores)
+    n_pos = int(cum_pos[-1]) if n else 0
+    n_neg = n - n_pos
+
+    thresholds = np.asarray(thresholds, dtype=float)
+    # Number of rows scoring above each threshold.
+    k = np.searchsorted(-sorted_scores, -thresholds, side='left')
+    tp = np.where(k > 0, cum_pos[np.maximum(k - 1, 0)], 0)
+    fp = k - tp
+    fn = n_pos - tp
+    tn = n_neg - fp
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 0.0)
+        recall = np.where(n_pos > 0, tp / max(n_pos, 1), 0.0)
+        specificity = np.where(n_neg > 0, tn / max(n_neg, 1), 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    accuracy = (tp + tn) / max(n, 1)
+
+    at = [{'threshold': float(t), 'tn': int(tn[i]), 'fp': int(fp[i]), 'fn': int(fn[i]), 'tp': int(tp[i]),
+           'accuracy': float(accuracy[i]), 'precision': float(precision[i]), 'recall': float(recall[i]),
+           'specificity': float(specificity[i]), 'fpr': float(1 - specificity[i]), 'f1': float(f1[i])}
+          for i, t in enumerate(thresholds)]
+    return {'auc': _trapezoid(fpr, tpr), 'average_precision': _average_precision(sorted_scores, cum_pos),
+            'fpr': fpr, 'tpr': tpr, 'roc_thresholds': roc_thresholds, 'at': at}
+
+
+def confusion_matrix(result, i=0):
+    """The [[tn, fp], [fn, tp]] matrix of threshold `i` of an `evaluate` result."""
+    at = result['at'][i]
+    return np.array([[at['tn'], at['fp']], [at['fn'], at['tp']]])
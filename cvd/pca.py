@@ -0,0 +1,144 @@
+"""Principal component analysis fit once from the covariance matrix.
+
+The notebook used to fit `PCA()` for the explained-variance plot, fit
+`PCA(n_components=10)` again from scratch, and project both splits. With
+13 encoded features the exact decomposition does not need an SVD of the
+data matrix: `PCAStage.fit` accumulates the mean and covariance in one pass
+over row batches (pairwise merged, as in `cvd.eda`) and takes the
+eigendecomposition of the 13 x 13 covariance. The cost is one matrix
+product per batch, with memory independent of the row count, and the full
+spectrum is kept, so the number of components is chosen from the same fit
+(`n_components_for`, `set_n_components`) instead of a second one.
+
+The components follow the sign convention of scikit-learn's `PCA`, and
+`components_`, `mean_`, `explained_variance_ratio_` and `transform` behave
+like its attributes and method, so a fitted stage can replace it in the
+notebook, `cvd.cv` and exported models.
+
+With a `cache_dir`, the fitted spectrum and the projected matrices are
+stored on disk keyed by a fingerprint of the data, and re-running the
+notebook loads them instead of recomputing.
+"""
+import os
+
+import numpy as np
+
+from cvd.search import fingerprint
+
+BATCH_ROWS = 65536
+
+
+def _moments(X, batch_rows=BATCH_ROWS):
+    """Row count, mean and centered co-moment matrix of X, batch by batch."""
+    n, mean, m2 = 0, np.zeros(X.shape[1]), np.zeros((X.shape[1], X.shape[1]))
+    for start in range(0, len(X), batch_rows):
+        batch = np.asarray(X[start:start + batch_rows], dtype=np.float64)
+        batch_mean = batch.mean(axis=0)
+        batch = batch - batch_mean
+        total = n + len(batch)
+        delta = batch_mean - mean
+        m2 = m2 + batch.T @ batch + np.outer(delta, delta) * (n * len(batch) / total)
+        mean = mean + delta * (len(batch) / total)
+        n = total
+    return n, mean, m2
+
+
+class PCAStage:
+    """Exact PCA from the covariance matrix, keeping the full spectrum.
+
+    `n_components` is the number of components `transform` keeps: an int, a
+    fraction of variance to explain (0 < n_components < 1), or None for all.
+    It can be changed after fitting with `set_n_components`.
+    """
+
+    def __init__(self, n_components=None, cache_dir=None, batch_rows=BATCH_ROWS):
+        self.n_components = n_components
+        self.cache_dir = cache_dir
+        self.batch_rows = batch_rows
+
+    def _cache_path(self, key, suffix):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        return os.path.join(self.cache_dir, key + suffix)
+
+    def fit(self, X, y=None):
+        X = np.asarray(X)
+        path = self._cache_path(fingerprint(X), '.npz') if self.cache_dir else None
+        if path and os.path.exists(path):
+            with np.load(path) as spectrum:
+                self.n_samples_, self.mean_ = int(spectrum['n_samples']), spectrum['mean']
+                self.eigenvalues_, self.eigenvectors_ = spectrum['eigenvalues'], spectrum['eigenvectors']
+        else:
+            n, mean, m2 = _moments(X, self.batch_rows)
+            eigenvalues, eigenvectors = np.linalg.eigh(m2 / max(n - 1, 1))
+            order = np.argsort(eigenvalues)[::-1]
+            eigenvalues = np.clip(eigenvalues[order], 0, None)
+            eigenvectors = eigenvectors[:, order].T
+            # scikit-learn's sign convention: the largest loading of each component is positive
+            signs = np.sign(eigenvectors[np.arange(len(eigenvectors)), np.abs(eigenvectors).argmax(axis=1)])
+            self.n_samples_, self.mean_ = n, mean
+            self.eigenvalues_, self.eigenvectors_ = eigenvalues, eigenvectors * signs[:, None]
+            if path:
+                np.savez(path, n_samples=n, mean=mean, eigenvalues=self.eigenvalues_,
+                         eigenvectors=self.eigenvectors_)
+        self.n_features_in_ = len(self.mean_)
+        return self.set_n_components(self.n_components)
+
+    @property
+    def cumulative_variance_ratio_(self):
+        """Fraction of the variance explained by the first 1, 2, ... components of the full spectrum."""
+        total = self.eigenvalues_.sum()
+        return np.cumsum(self.eigenvalues_) / total if total > 0 else np.ones(len(self.eigenvalues_))
+
+    def n_components_for(self, threshold):
+        """Smallest number of components explaining at least `threshold` of the variance."""
+        if not 0 < threshold <= 1:
+            raise ValueError(f'threshold must be in (0, 1], got {threshold}')
+        cumulative = self.cumulative_variance_ratio_
+        return int(min(np.searchsorted(cumulative, threshold - 1e-12) + 1, len(cumulative)))
+
+    def set_n_components(self, n_components):
+        """Keep `n_components` (int, variance fraction or None) of the fitted spectrum; returns self."""
+        if n_components is None:
+            n = len(self.eigenvalues_)
+        elif isinstance(n_components, float) and 0 < n_components < 1:
+            n = self.n_components_for(n_components)
+        elif 1 <= n_components <= len(self.eigenvalues_):
+            n = int(n_components)
+        else:
+            raise ValueError(f'n_components must be a variance fraction or between 1 and {len(self.eigenvalues_)}, '
+                             f'got {n_components}')
+        self.n_components = n_components
+        self.n_components_ = n
+        self.components_ = self.eigenvectors_[:n]
+        self.explained_variance_ = self.eigenvalues_[:n]
+        total = self.eigenvalues_.sum()
+        self.explained_variance_ratio_ = self.explained_variance_ / total if total > 0 else self.explained_variance_
+        return self
+
+    def transform(self, X):
+        """Project X onto the kept components (float32)."""
+        X = np.asarray(X)
+        components = self.components_.T.astype(np.float32)
+        mean = self.mean_.astype(np.float32)
+        out = np.empty((len(X), self.n_components_), dtype=np.float32)
+        for start in range(0, len(X), self.batch_rows):
+            batch = np.asarray(X[start:start + self.batch_rows], dtype=np.float32)
+            out[start:start + len(batch)] = (batch - mean) @ components
+        return out
+
+    def fit_transform(self, X, y=None):
+        return self.fit(X).transform(X)
+
+    def project(self, *arrays):
+        """`transform` of each array, loaded from and saved to `cache_dir` when one is set."""
+        if not self.cache_dir:
+            return tuple(self.transform(X) for X in arrays)
+        projected = []
+        for X in arrays:
+            path = self._cache_path(fingerprint(self.mean_, self.components_, np.asarray(X)), '.npy')
+            if os.path.exists(path):
+                projected.append(np.load(path))
+            else:
+                projected.append(self.transform(X))
+                np.save(path, projected[-1])
+        return tuple(projected)
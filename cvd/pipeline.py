@@ -0,0 +1,419 @@
+"""The notebook's modeling workflow as separate, importable stages.
+
+Each stage is a plain function of the outputs of the earlier ones:
+
+    load      -> raw        survey rows, sorted by Age_Category
+    clean     -> cleaned    rows passing the schema, dropped columns, de-duplicated
+    encode    -> encoded    model features X in a compact FeatureStore and the target y
+    split     -> split      train / test split of the stored rows
+    scale     -> scaled     StandardScaler fitted on the training rows
+    train     -> model      fitted classifier (best grid point when given a grid)
+    evaluate  -> metrics    test AUROC, ROC curve, confusion matrix
+    report    -> report     metrics JSON, plots and exported model artifacts
+
+`run` produces the outputs of any subset of the stages, running only
+what is not memoized on disk. Every output is content-addressed: its key hashes the
+stage's code version, its options and the keys of its inputs, down to the
+SHA-256 of the source CSV. A stage whose key is cached is skipped, and the
+cache drops the least recently used outputs beyond a size limit. Changing
+only the model or its grid therefore starts training at once from the
+cached scaled arrays, without loading or preprocessing the data again.
+
+Only the standard library is imported with this module. pandas, sklearn,
+xgboost and matplotlib are imported inside the stages that use them, and
+`score` (NumPy-only scoring of CSVs with an `export_scorer` file) never
+loads sklearn or xgboost, so batch scoring jobs start quickly.
+
+Usage:
+    python -m cvd run
+    python -m cvd run --model rf --params '{"max_depth": [5, 10], "n_estimators": 100}'
+    python -m cvd run --stages scale --source brfss_2023.csv --max-cache-mb 500
+    python -m cvd score models/cvd_xgb.npz brfss_2023.csv --output scores.csv
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+STAGES = ('load', 'clean', 'encode', 'split', 'scale', 'train', 'evaluate', 'report')
+# Bump the version of a stage when its code changes what it computes.
+STAGE_VERSIONS = {'load': 1, 'clean': 2, 'encode': 2, 'split': 2, 'scale': 2, 'train': 2, 'evaluate': 1, 'report': 1}
+# Options that do not change the output of a stage.
+UNKEYED_OPTIONS = ('cache_dir', 'sha256')
+# Stages with side effects, which always run.
+UNCACHED_STAGES = ('report',)
+MAX_CACHE_BYTES = 2 << 30
+# Model -> parameters `train` uses when none are given: the notebook's best XGBoost grid point.
+DEFAULT_PARAMS = {'xgb': {'eta': 0.2, 'gamma': 1, 'max_depth': 4}}
+# Stage -> (input artifacts, output artifact).
+ARTIFACTS = {
+    'load': ((), 'raw'),
+    'clean': (('raw',), 'cleaned'),
+    'encode': (('cleaned',), 'encoded'),
+    'split': (('encoded',), 'split'),
+    'scale': (('split',), 'scaled'),
+    'train': (('scaled',), 'model'),
+    'evaluate': (('model', 'scaled'), 'metrics'),
+    'report': (('metrics', 'model', 'scaled'), 'report'),
+}
+
+
+def load(source=None, cache_dir=None, sha256=None):
+    """Raw survey rows with categorical dtypes, sorted by Age_Category as in the notebook.
+
+    `source` is a URL or path of CVD_cleaned.csv (the GitHub copy by
+    default), loaded through the `cvd.data` cache. `run` passes the
+    `sha256` that keys the stage, so the rows cached under a key are always
+    the content it was computed from.
+    """
+    from cvd import data
+
+    df = data.load_cvd(source or data.GITHUB_URL, cache_dir or data.CACHE_DIR, sha256=sha256)
+    return df.sort_values(by='Age_Category').reset_index(drop=True)
+
+
+def clean(raw):
+    """The notebook's cleaning: drop invalid rows (`cvd.schema.RULES`), General_Health, Checkup and duplicates."""
+    from cvd import data
+    from cvd.dedupe import drop_duplicates
+    from cvd.schema import Validator
+
+    return drop_duplicates(data.clean(Validator().validate(raw)))
+
+
+def encode(cleaned):
+    """{'X', 'y', 'feature_names'}: model features in a compact `cvd.store.FeatureStore` and the int8 target."""
+    import numpy as np
+
+    from cvd.encoding import MODEL_COLUMNS, TARGET
+    from cvd.store import FeatureStore
+
+    X = FeatureStore.from_frame(cleaned, MODEL_COLUMNS)
+    return {'X': X, 'y': (cleaned[TARGET] == 'Yes').to_numpy(dtype=np.int8), 'feature_names': X.names}
+
+
+def split(encoded, test_size=0.2, seed=42):
+    """Train / test split of the encoded rows, as in section 4.2 of the notebook; the parts stay compact."""
+    import numpy as np
+    from sklearn.model_selection import train_test_split
+
+    # The shuffle only depends on the number of rows, so splitting row numbers picks the same rows.
+    train_rows, test_rows = train_test_split(np.arange(len(encoded['y'])), test_size=test_size, random_state=seed)
+    return {'X_train': encoded['X'].take(train_rows), 'X_test': encoded['X'].take(test_rows),
+            'y_train': encoded['y'][train_rows], 'y_test': encoded['y'][test_rows],
+            'feature_names': encoded['feature_names']}
+
+
+def scale(split):
+    """Dense float32 features of both parts, standardized in place with a scaler fitted on the training rows."""
+    from sklearn.preprocessing import StandardScaler
+
+    from cvd.store import standardize_
+
+    X_train, X_test = split['X_train'].dense(), split['X_test'].dense()
+    scaler = StandardScaler().fit(X_train)
+    return dict(split, scaler=scaler, X_train=standardize_(X_train, scaler), X_test=standardize_(X_test, scaler))
+
+
+def train(scaled, model='xgb', params=None, cache_dir=None):
+    """Fit `model` (a key of `cvd.search.MODELS`) on the scaled training rows.
+
+    List values in `params` form a grid; the grid point with the best test
+    AUROC is selected with `cvd.search.search`, as in the notebook, and refit.
+    Without `params`, a model in `DEFAULT_PARAMS` gets the notebook's choice.
+    """
+    from cvd.search import best_result, make_model, search
+
+    params = dict(DEFAULT_PARAMS.get(model, {}) if params is None else params)
+    if any(isinstance(value, list) for value in params.values()):
+        grid = {name: value if isinstance(value, list) else [value] for name, value in params.items()}
+        results = search(model, grid, scaled['X_train'], scaled['y_train'], scaled['X_test'], scaled['y_test'],
+                         cache_dir=cache_dir)
+        params = best_result(results)['params']
+    start = time.perf_counter()
+    estimator = make_model(model, params).fit(scaled['X_train'], scaled['y_train'])
+    return {'model': model, 'params': params, 'estimator': estimator, 'fit_time': time.perf_counter() - start}
+
+
+def evaluate(model, scaled, thresholds=(0.5,)):
+    """Test-set metrics of the trained model (see `cvd.metrics.evaluate`)."""
+    from cvd import metrics
+
+    scores = model['estimator'].predict_proba(scaled['X_test'])[:, 1]
+    return dict(metrics.evaluate(scaled['y_test'], scores, thresholds), model=model['model'], params=model['params'])
+
+
+def report(metrics, model, scaled, output_dir='reports'):
+    """Write metrics.json, the ROC curve and confusion matrix plots and the model artifacts to `output_dir`."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import numpy as np
+
+    from cvd import metrics as cvd_metrics
+    from cvd.encoding import MODEL_COLUMNS, Encoder
+    from cvd.scorer import export_scorer
+    from cvd.serve import export_model
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {name: os.path.join(output_dir, name)
+             for name in ('metrics.json', 'roc.png', 'confusion.png', 'model.joblib', 'model.npz')}
+    summary = {key: metrics[key] for key in ('model', 'params', 'auc', 'at')}
+    with open(paths['metrics.json'], 'w') as f:
+        json.dump(summary, f, indent=2, default=float)
+
+    fig, ax = plt.subplots(figsize=(8, 6))
+    ax.plot(metrics['fpr'], metrics['tpr'], label=f"AUROC = {metrics['auc']:.2f}")
+    ax.set(xlabel='False Positive Rate', ylabel='True Positive Rate',
+           title='Receiver Operating Characteristic (ROC) Curve')
+    ax.legend()
+    fig.savefig(paths['roc.png'])
+    fig, ax = plt.subplots(figsize=(8, 4))
+    cm = np.asarray(cvd_metrics.confusion_matrix(metrics))
+    ax.imshow(cm, cmap='coolwarm')
+    for (i, j), count in np.ndenumerate(cm):
+        ax.text(j, i, f'{count:g}', ha='center', va='center')
+    ax.set(xlabel='Predicted', ylabel='Actual', title='Confusion Matrix', xticks=[0, 1], yticks=[0, 1])
+    fig.savefig(paths['confusion.png'])
+    plt.close('all')
+
+    encoder = Encoder(MODEL_COLUMNS)
+    export_model(paths['model.joblib'], encoder, scaled['scaler'], model['estimator'])
+    try:
+        export_scorer(paths['model.npz'], encoder, scaled['scaler'], model['estimator'])
+    except ValueError:
+        # Only linear models and XGBoost have a NumPy-only scorer; drop an earlier run's, which
+        # would score with another model.
+        if os.path.exists(paths['model.npz']):
+            os.remove(paths['model.npz'])
+        del paths['model.npz']
+    return paths
+
+
+def _source_digest(source, cache_dir):
+    """SHA-256 of the CSV the load stage reads (downloading it into the data cache if needed)."""
+    from cvd import data
+
+    if os.path.exists(source):
+        return data._sha256(source)
+    manifest = data.read_manifest(cache_dir)
+    if manifest is None or manifest['source'] != source:
+        manifest = data.build_cache(source, cache_dir)
+    return manifest['sha256']
+
+
+def stage_keys(options=None):
+    """Content address of every stage output.
+
+    The key of a stage hashes its name, its `STAGE_VERSIONS` entry, its
+    options (except `UNKEYED_OPTIONS`) and the keys of its inputs; the load
+    stage hashes the content of its source instead. A key therefore changes
+    exactly when the stage or anything upstream of it would compute something
+    else.
+    """
+    from cvd import data
+
+    options = options or {}
+    load_options = options.get('load', {})
+    source = load_options.get('source') or data.GITHUB_URL
+    producer = {output: stage for stage, (_, output) in ARTIFACTS.items()}
+    keys = {}
+    for stage in STAGES:
+        inputs, _ = ARTIFACTS[stage]
+        stage_options = {name: value for name, value in options.get(stage, {}).items()
+                         if name not in UNKEYED_OPTIONS}
+        parts = [stage, STAGE_VERSIONS[stage], stage_options, [keys[producer[name]] for name in inputs]]
+        if stage == 'load':
+            parts.append(load_options.get('sha256') or
+                         _source_digest(source, load_options.get('cache_dir') or data.CACHE_DIR))
+        keys[stage] = hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+    return keys
+
+
+class StageCache:
+    """Directory of stage outputs stored by key, evicted least recently used first.
+
+    Every read refreshes the modification time of the file; after a write,
+    the oldest files are deleted until the directory fits in `max_bytes`.
+    """
+
+    def __init__(self, path, max_bytes=MAX_CACHE_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def _file(self, key):
+        return os.path.join(self.path, key + '.joblib')
+
+    def __contains__(self, key):
+        return os.path.exists(self._file(key))
+
+    def get(self, key):
+        import joblib
+
+        value = joblib.load(self._file(key), mmap_mode='r')
+        os.utime(self._file(key))
+        return value
+
+    def put(self, key, value):
+        import joblib
+
+        os.makedirs(self.path, exist_ok=True)
+        tmp = f'{self._file(key)}.{os.getpid()}.tmp'
+        joblib.dump(value, tmp)
+        os.replace(tmp, self._file(key))
+        self.evict(keep=key)
+
+    def entries(self):
+        """(mtime, size, path) of the cached files, least recently used first."""
+        entries = []
+        for name in os.listdir(self.path) if os.path.isdir(self.path) else ():
+            if name.endswith('.joblib'):
+                stat = os.stat(os.path.join(self.path, name))
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(self.path, name)))
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        """Delete least recently used files until the cache fits in `max_bytes`; returns the bytes freed."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        freed = 0
+        for _, size, path in entries:
+            if total - freed <= self.max_bytes:
+                break
+            if keep is not None and path == self._file(keep):
+                continue
+            os.remove(path)
+            freed += size
+        return freed
+
+
+def run(stages=('report',), cache_dir=None, options=None, max_bytes=MAX_CACHE_BYTES, verbose=True):
+    """Produce the outputs of `stages` and return them by artifact name.
+
+    `options` maps a stage name to the keyword arguments of its function.
+    Outputs are memoized in a `StageCache` under `cache_dir` by `stage_keys`.
+    A requested output is read from the cache when its key is there;
+    otherwise its stage runs, after its own inputs have been resolved the
+    same way. Upstream outputs that are not needed are never loaded. The
+    report stage writes files and always runs.
+    """
+    from cvd import data
+
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise ValueError(f'Unknown stages {sorted(unknown)}; expected some of {STAGES}')
+    options = dict(options or {})
+    load_options = dict(options.get('load', {}))
+    if not load_options.get('sha256'):
+        # Key and load the same content, even if the source changes in between.
+        load_options['sha256'] = _source_digest(load_options.get('source') or data.GITHUB_URL,
+                                                load_options.get('cache_dir') or data.CACHE_DIR)
+    options['load'] = load_options
+    cache = StageCache(cache_dir or os.path.join(data.CACHE_DIR, 'stages'), max_bytes)
+    keys = stage_keys(options)
+    producer = {output: stage for stage, (_, output) in ARTIFACTS.items()}
+    module = sys.modules[__name__]
+    outputs = {}
+
+    def resolve(stage):
+        inputs, output = ARTIFACTS[stage]
+        if output in outputs:
+            return outputs[output]
+        start = time.perf_counter()
+        if stage not in UNCACHED_STAGES and keys[stage] in cache:
+            outputs[output] = cache.get(keys[stage])
+            status = 'cached'
+        else:
+            args = [resolve(producer[name]) for name in inputs]
+            start = time.perf_counter()
+            outputs[output] = getattr(module, stage)(*args, **options.get(stage, {}))
+            if stage not in UNCACHED_STAGES:
+                cache.put(keys[stage], outputs[output])
+            status = 'ran'
+        if verbose:
+            print(f'{stage:<9} {status:<7} {time.perf_counter() - start:8.2f} s  {keys[stage][:12]}')
+        return outputs[output]
+
+    for stage in (stage for stage in STAGES if stage in stages):
+        resolve(stage)
+    cache.evict()
+    return {ARTIFACTS[stage][1]: outputs[ARTIFACTS[stage][1]] for stage in STAGES if stage in stages}
+
+
+def score(scorer_path, paths, output, chunksize=200000, quarantine=None):
+    """Score survey CSVs with an `export_scorer` file, chunk by chunk, without sklearn or xgboost.
+
+    Writes a CSV of (source, row, probability) for the rows that pass
+    `cvd.schema.RULES`; the others go to the `quarantine` CSV when one is
+    given. Returns the validation counts, whose 'valid' rows were scored.
+    """
+    import pandas as pd
+
+    from cvd import data
+    from cvd.encoding import Encoder
+    from cvd.schema import Validator
+    from cvd.scorer import Scorer
+
+    scorer = Scorer.load(scorer_path)
+    encoder = Encoder(scorer.columns)
+    validator = Validator(quarantine=quarantine)
+    n_rows = 0
+    with open(output, 'w', newline='') as f:
+        for path, chunk in validator.stream(paths, chunksize):
+            chunk = data.clean(chunk)
+            scores = pd.DataFrame({'source': path, 'row': chunk.index,
+                                   'probability': scorer.predict_proba(encoder.transform(chunk))})
+            scores.to_csv(f, header=not n_rows, index=False)
+            n_rows += len(scores)
+    return validator.counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m cvd', description='Run the CVD modeling pipeline.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run pipeline stages')
+    run_parser.add_argument('--stages', nargs='+', choices=STAGES, default=['evaluate', 'report'],
+                            help='stages whose outputs to produce (their inputs are resolved as needed)')
+    run_parser.add_argument('--cache-dir', help='stage output cache (default: $CVD_CACHE_DIR/stages)')
+    run_parser.add_argument('--max-cache-mb', type=float, default=MAX_CACHE_BYTES / 2 ** 20)
+    run_parser.add_argument('--source', help='CVD_cleaned.csv URL or path (default: the GitHub copy)')
+    run_parser.add_argument('--test-size', type=float, default=0.2)
+    run_parser.add_argument('--seed', type=int, default=42)
+    run_parser.add_argument('--model', default='xgb', help='logreg, tree, rf or xgb')
+    run_parser.add_argument('--params', type=json.loads,
+                            help='JSON model parameters; list values are searched as a grid '
+                                 '(default: the notebook\'s choice for xgb)')
+    run_parser.add_argument('--search-cache', help='directory of cached grid search results')
+    run_parser.add_argument('--output-dir', default='reports')
+
+    score_parser = commands.add_parser('score', help='score CSVs with a NumPy-only scorer file')
+    score_parser.add_argument('scorer', help='.npz file written by export_scorer')
+    score_parser.add_argument('paths', nargs='+', help='CSV files shaped like CVD_cleaned.csv')
+    score_parser.add_argument('--output', required=True, help='CSV of probabilities to write')
+    score_parser.add_argument('--chunksize', type=int, default=200000)
+    score_parser.add_argument('--quarantine', help='CSV to write rows failing validation to, with the reasons')
+    args = parser.parse_args(argv)
+
+    if args.command == 'score':
+        start = time.perf_counter()
+        counts = score(args.scorer, args.paths, args.output, args.chunksize, args.quarantine)
+        print(f"{counts['valid']:,} rows scored in {time.perf_counter() - start:.2f} s -> {args.output}, "
+              f"{counts['quarantined']:,} quarantined")
+        return 0
+
+    options = {
+        'load': {'source': args.source},
+        'split': {'test_size': args.test_size, 'seed': args.seed},
+        'train': {'model': args.model, 'params': args.params, 'cache_dir': args.search_cache},
+        'report': {'output_dir': args.output_dir},
+    }
+    outputs = run(args.stages, args.cache_dir, options, int(args.max_cache_mb * 2 ** 20))
+    if 'metrics' in outputs:
+        metrics = outputs['metrics']
+        print(f"{metrics['model']} {metrics['params']}: test AUROC {metrics['auc']:.4f}")
+    if 'report' in outputs:
+        print('\n'.join(outputs['report'].values()))
+    return 0
@@ -0,0 +1,217 @@
+"""Warm-started regularization paths for the logistic regression search.
+
+The notebook's logistic grids fit a saga `LogisticRegression` from a cold
+start for every (C, penalty) point, and warm-starting saga does not help:
+it rebuilds its gradient memory on every call and takes as many epochs
+again. `logreg_path` instead solves the C sequence of each penalty in one
+sweep, from the strongest regularization to the weakest, with the
+proximal Newton method of glmnet. Each iteration is one weighted Gram
+matrix of the (few) encoded features, computed in a single pass over the
+rows, followed by coordinate descent on the quadratic model, which only
+touches that small matrix. Starting every C from the previous solution,
+most points converge in two or three iterations, so a fine C sequence
+costs less than the three-point grid.
+
+The objective is scikit-learn's (`C` times the summed log-loss plus the
+l1, l2 or elastic-net penalty, unpenalized intercept), so the solutions
+are those saga converges to. Every point of the path is kept: its
+coefficient vector, intercept and train/test AUROC, in the result format
+of `cvd.search.search`. The chosen model is a `LogisticRegression` built
+from the stored coefficients of the best point instead of being refit.
+With a `cache_dir`, each penalty's path is stored with the search results
+and re-running the notebook loads it.
+
+Usage:
+    python -m cvd.regpath --rows 300000
+    python -m cvd.regpath --csv CVD_cleaned.csv --n-cs 13
+"""
+import argparse
+import time
+
+import numpy as np
+
+from cvd.metrics import auroc
+from cvd.search import ResultCache, fingerprint, make_model
+
+PENALTIES = ('l1', 'l2', 'elasticnet')
+CS = (0.01, 1.0, 100)
+# Fraction of the penalty that is l1; elastic net uses the 0.5 of `cvd.search`.
+L1_RATIOS = {'l1': 1.0, 'l2': 0.0, 'elasticnet': 0.5}
+TOL = 1e-8
+MAX_ITER = 100
+
+
+def _objective(eta, y, beta, l1, l2):
+    """Summed log-loss at linear predictor `eta` plus the penalty of `beta` (intercept first, unpenalized)."""
+    return (np.logaddexp(0, eta) - y * eta).sum() + l1 * np.abs(beta[1:]).sum() + l2 / 2 * beta[1:] @ beta[1:]
+
+
+def _coordinate_descent(H, g, beta, l1, l2, tol=1e-12, max_sweeps=1000):
+    """Minimize g.(b - beta) + (b - beta).H.(b - beta) / 2 + penalty(b) over b, one coordinate at a time."""
+    b = beta.copy()
+    grad = g.copy()
+    for _ in range(max_sweeps):
+        largest = 0.0
+        for j in range(len(b)):
+            if H[j, j] <= 0:
+                continue
+            # Closed-form minimum along coordinate j, the others fixed.
+            c = H[j, j] * b[j] - grad[j]
+            if j == 0:
+                new = c / H[j, j]
+            else:
+                new = np.sign(c) * max(abs(c) - l1, 0.0) / (H[j, j] + l2)
+            step = new - b[j]
+            if step:
+                grad += H[:, j] * step
+                b[j] = new
+                largest = max(largest, abs(step))
+        if largest < tol:
+            break
+    return b
+
+
+def _solve(X1, y, beta, l1, l2, tol=TOL, max_iter=MAX_ITER):
+    """Proximal Newton from `beta`; returns the solution and the number of iterations."""
+    eta = X1 @ beta
+    f = _objective(eta, y, beta, l1, l2)
+    for iteration in range(1, max_iter + 1):
+        p = 1 / (1 + np.exp(-eta))
+        g = X1.T @ (p - y)
+        H = (X1 * (p * (1 - p))[:, None]).T @ X1
+        new = _coordinate_descent(H, g, beta, l1, l2)
+        step = new - beta
+        # Backtracking line search with the sufficient decrease condition of Tseng and Yun.
+        decrease = g @ step + l1 * (np.abs(new[1:]).sum() - np.abs(beta[1:]).sum()) \
+            + l2 / 2 * (new[1:] @ new[1:] - beta[1:] @ beta[1:])
+        t = 1.0
+        while True:
+            candidate = beta + t * step
+            eta_candidate = X1 @ candidate
+            f_candidate = _objective(eta_candidate, y, candidate, l1, l2)
+            if f_candidate <= f + 1e-4 * t * decrease or t < 1e-10:
+                break
+            t /= 2
+        beta, eta, f = candidate, eta_candidate, f_candidate
+        if np.abs(t * step).max() <= tol * max(1.0, np.abs(beta).max()):
+            break
+    return beta, iteration
+
+
+def _path(penalty, Cs, X_train, y_train, X_test, y_test, tol, max_iter):
+    """Solve `Cs` (ascending) in turn for one penalty, each starting from the previous solution."""
+    X1 = np.column_stack([np.ones(len(X_train)), X_train])
+    y = np.asarray(y_train, dtype=np.float64)
+    beta = np.zeros(X1.shape[1])
+    results = []
+    for C in Cs:
+        start = time.perf_counter()
+        # scikit-learn's C * loss + penalty, divided by C.
+        beta, n_iter = _solve(X1, y, beta, L1_RATIOS[penalty] / C, (1 - L1_RATIOS[penalty]) / C, tol, max_iter)
+        fit_time = time.perf_counter() - start
+        coef, intercept = beta[1:], beta[0]
+        results.append({
+            'params': {'C': C, 'penalty': penalty},
+            'train_auc': auroc(y_train, X_train @ coef + intercept),
+            'test_auc': auroc(y_test, X_test @ coef + intercept),
+            'fit_time': fit_time,
+            'n_rows': len(y_train),
+            'n_iter': n_iter,
+            'coef': coef.tolist(),
+            'intercept': float(intercept),
+        })
+    return results
+
+
+def model_from_result(result, classes=(0, 1)):
+    """A fitted `LogisticRegression` with the coefficients stored in a path result."""
+    estimator = make_model('logreg', result['params'])
+    estimator.classes_ = np.asarray(classes)
+    estimator.coef_ = np.asarray(result['coef'])[None, :]
+    estimator.intercept_ = np.array([result['intercept']])
+    estimator.n_features_in_ = estimator.coef_.shape[1]
+    estimator.n_iter_ = np.array([result['n_iter']])
+    return estimator
+
+
+def logreg_path(X_train, y_train, X_test, y_test, Cs=CS, penalties=PENALTIES, tol=TOL, max_iter=MAX_ITER,
+                cache_dir=None, key='test_auc', verbose=True):
+    """Regularization path of the logistic regression for each of `penalties`.
+
+    Returns a dict with the per-point `results` (ordered by penalty, then
+    ascending C), the coefficient paths `coefs` (penalties x Cs x features),
+    the `best` result by `key` and the chosen `model`, already fitted.
+    """
+    Cs = sorted(float(C) for C in Cs)
+    X_train, X_test = np.asarray(X_train, dtype=np.float64), np.asarray(X_test, dtype=np.float64)
+    data = (X_train, np.asarray(y_train), X_test, np.asarray(y_test))
+    data_key = fingerprint(*data) + f'-tol{tol}-iter{max_iter}'
+    cache = ResultCache(cache_dir) if cache_dir is not None else None
+    results = []
+    for penalty in penalties:
+        params = {'penalty': penalty, 'Cs': Cs}
+        path = cache.get('logreg-path', params, data_key, None) if cache is not None else None
+        if path is None:
+            path = _path(penalty, Cs, *data, tol, max_iter)
+            if cache is not None:
+                cache.put('logreg-path', params, data_key, None, path)
+            path = [dict(result, cached=False) for result in path]
+        else:
+            path = [dict(result, cached=True) for result in path]
+        results.extend(path)
+    if verbose:
+        for result in results:
+            print(f"Hyperparameters: {result['params']}, Newton iterations: {result['n_iter']}, "
+                  f"Train AUROC: {result['train_auc']}, Test AUROC: {result['test_auc']}")
+    best = max(results, key=lambda r: r[key])
+    return {
+        'Cs': np.array(Cs),
+        'penalties': list(penalties),
+        'results': results,
+        'coefs': np.array([r['coef'] for r in results]).reshape(len(penalties), len(Cs), -1),
+        'best': best,
+        'model': model_from_result(best, np.unique(data[1])),
+    }
+
+
+def main(argv=None):
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import StandardScaler
+
+    from cvd import data, synthetic
+    from cvd.encoding import MODEL_COLUMNS, TARGET, Encoder
+    from cvd.search import best_result, search
+
+    parser = argparse.ArgumentParser(description='Compare the regularization path with the logistic grid search.')
+    parser.add_argument('--csv', help='CSV shaped like CVD_cleaned.csv (default: synthetic rows)')
+    parser.add_argument('--rows', type=int, default=300000, help='synthetic rows when no --csv is given')
+    parser.add_argument('--n-cs', type=int, default=len(CS), help='C values on the path, log-spaced over the grid')
+    parser.add_argument('--n-jobs', type=int, default=-1, help='worker processes of the grid search')
+    args = parser.parse_args(argv)
+
+    df = data.read_csv(args.csv) if args.csv else synthetic.generate(args.rows)
+    df = data.clean(df.drop_duplicates())
+    X = Encoder(MODEL_COLUMNS).transform(df)
+    y = (df[TARGET] == 'Yes').to_numpy(dtype=np.int8)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    scaler = StandardScaler().fit(X_train)
+    X_train, X_test = scaler.transform(X_train), scaler.transform(X_test)
+
+    # The grid search, plus the refit of its best point that the notebook does.
+    start = time.perf_counter()
+    best = best_result(search('logreg', {'C': list(CS), 'penalty': list(PENALTIES)}, X_train, y_train, X_test,
+                              y_test, n_jobs=args.n_jobs, verbose=False))
+    make_model('logreg', best['params']).fit(X_train, y_train)
+    grid_time = time.perf_counter() - start
+    print(f"grid     {grid_time:8.1f} s  best {best['params']}  test AUROC {best['test_auc']:.4f}")
+
+    start = time.perf_counter()
+    path = logreg_path(X_train, y_train, X_test, y_test, Cs=np.logspace(-2, 2, args.n_cs), verbose=False)
+    path_time = time.perf_counter() - start
+    print(f"path     {path_time:8.1f} s  best {path['best']['params']}  test AUROC {path['best']['test_auc']:.4f}  "
+          f"({len(path['results'])} points)")
+    print(f"speed-up {grid_time / path_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""Declarative validation of incoming survey rows, with a quarantine file.
+
+`RULES` declares, for every column of CVD_cleaned.csv, its allowed
+categories or numeric range and whether it may be missing. `Validator`
+checks every rule over a whole chunk at once (one `isin` or comparison per
+column), keeps the rows that pass and appends the others to a quarantine
+CSV with the reasons they failed, so nothing is dropped silently. `counts`
+gives the rows checked, kept and quarantined, and the failures per rule.
+
+Diabetes only allows 'Yes' and 'No': the models use it as a binary
+feature, and the pre-diabetes and pregnancy answers, which `cvd.data.clean`
+used to filter out without a trace, now land in the quarantine with their
+reason.
+
+Usage:
+    python -m cvd.schema brfss_2023.csv --quarantine quarantine.csv
+"""
+import argparse
+import glob
+
+import numpy as np
+import pandas as pd
+
+from cvd import data
+
+# Column -> rule. 'categories': allowed values; 'range': inclusive (min, max)
+# of a numeric column; 'nullable': whether the column may be missing.
+# Heights and weights are the bounds the survey accepts; BMI is bounded to
+# plausible adult values; consumption columns are times per month.
+RULES = {
+    'General_Health': {'categories': list(data.CATEGORIES['General_Health'].categories)},
+    'Checkup': {'categories': list(data.CATEGORIES['Checkup'].categories)},
+    'Exercise': {'categories': ['No', 'Yes']},
+    'Heart_Disease': {'categories': ['No', 'Yes']},
+    'Skin_Cancer': {'categories': ['No', 'Yes']},
+    'Other_Cancer': {'categories': ['No', 'Yes']},
+    'Depression': {'categories': ['No', 'Yes']},
+    'Diabetes': {'categories': ['No', 'Yes']},
+    'Arthritis': {'categories': ['No', 'Yes']},
+    'Sex': {'categories': ['Female', 'Male']},
+    'Age_Category': {'categories': data.AGE_CATEGORIES},
+    'Height_(cm)': {'range': (91, 241)},
+    'Weight_(kg)': {'range': (24.95, 293.02)},
+    'BMI': {'range': (10, 100)},
+    'Smoking_History': {'categories': ['No', 'Yes']},
+    'Alcohol_Consumption': {'range': (0, 30)},
+    'Fruit_Consumption': {'range': (0, 120)},
+    'Green_Vegetables_Consumption': {'range': (0, 128)},
+    'FriedPotato_Consumption': {'range': (0, 128)},
+}
+
+
+def _checks(rules):
+    """(name, column, kind, argument) of every check implied by `rules`, in a fixed order."""
+    checks = []
+    for col, rule in rules.items():
+        if not rule.get('nullable', False):
+            checks.append((f'{col}:null', col, 'null', None))
+        if 'categories' in rule:
+            checks.append((f'{col}:categories', col, 'categories', rule['categories']))
+        if 'range' in rule:
+            checks.append((f'{col}:range', col, 'range', rule['range']))
+    return checks
+
+
+def _reason(kind, argument):
+    if kind == 'null':
+        return 'missing'
+    if kind == 'categories':
+        return f'not one of {argument}'
+    return f'outside [{argument[0]}, {argument[1]}]'
+
+
+class Validator:
+    """Checks chunks against `rules` and appends failing rows to the `quarantine` CSV.
+
+    The quarantine holds the failing rows as they were read, preceded by a
+    `source`, the row's number in its file and the `reasons` it failed. It
+    is truncated and given its header on the first chunk, even if every
+    row of the run passes.
+    """
+
+    def __init__(self, rules=RULES, quarantine=None):
+        self.rules = rules
+        self.quarantine = quarantine
+        self.checks = _checks(rules)
+        self.counts = {'rows': 0, 'valid': 0, 'quarantined': 0}
+        self.counts.update({name: 0 for name, *_ in self.checks})
+        self._header = True
+
+    def failures(self, df):
+        """Boolean (rows x checks) matrix of failed checks; raises ValueError if a column is missing."""
+        missing = [col for col in self.rules if col not in df.columns]
+        if missing:
+            raise ValueError(f'Missing columns: {missing}')
+        failed = np.zeros((len(df), len(self.checks)), dtype=bool)
+        numeric = {}
+        for j, (_, col, kind, argument) in enumerate(self.checks):
+            values = df[col]
+            if kind == 'null':
+                failed[:, j] = values.isna().to_numpy()
+            elif kind == 'categories':
+                failed[:, j] = (values.notna() & ~values.isin(argument)).to_numpy()
+            else:
+                if col not in numeric:
+                    # Text that does not parse as a number counts as out of range.
+                    numeric[col] = pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64)
+                x = numeric[col]
+                failed[:, j] = values.notna().to_numpy() & ~((x >= argument[0]) & (x <= argument[1]))
+        return failed
+
+    def validate(self, df, source=None):
+        """Rows of `df` passing every check; the others are counted and quarantined with their reasons."""
+        failed = self.failures(df)
+        bad = failed.any(axis=1)
+        self.counts['rows'] += len(df)
+        self.counts['quarantined'] += int(bad.sum())
+        self.counts['valid'] += int(len(df) - bad.sum())
+        for (name, *_), n in zip(self.checks, failed.sum(axis=0)):
+            self.counts[name] += int(n)
+        if self.quarantine is not None and (bad.any() or self._header):
+            # The first chunk always rewrites the file, so a quarantine left by an earlier run does not survive a
+            # clean one. Reasons are only built for the failing rows.
+            rows = np.flatnonzero(bad)
+            reasons = [[] for _ in rows]
+            for j, (_, col, kind, argument) in enumerate(self.checks):
+                for i in np.flatnonzero(failed[rows, j]):
+                    reasons[i].append(f'{col} {_reason(kind, argument)}')
+            quarantined = df.iloc[rows].copy()
+            quarantined.insert(0, 'reasons', ['; '.join(r) for r in reasons])
+            quarantined.insert(0, 'row', quarantined.index)
+            quarantined.insert(0, 'source', str(source))
+            quarantined.to_csv(self.quarantine, mode='w' if self._header else 'a', header=self._header,
+                               index=False)
+            self._header = False
+        return df[~bad]
+
+    def stream(self, paths, chunksize=100000):
+        """Yield (path, valid chunk) for CSV files shaped like CVD_cleaned.csv, with categorical dtypes."""
+        dtype = {col: 'category' for col in data.CATEGORIES}
+        for path in paths:
+            for chunk in pd.read_csv(path, dtype=dtype, chunksize=chunksize):
+                yield path, data.to_categorical(self.validate(chunk, path))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Validate survey CSVs against the CVD_cleaned.csv schema.')
+    parser.add_argument('paths', nargs='+', help='CSV files (globs allowed) shaped like CVD_cleaned.csv')
+    parser.add_argument('--quarantine', help='CSV to write the failing rows and their reasons to')
+    parser.add_argument('--chunksize', type=int, default=200000)
+    args = parser.parse_args(argv)
+
+    paths = [path for pattern in args.paths for path in sorted(glob.glob(pattern)) or [pattern]]
+    validator = Validator(quarantine=args.quarantine)
+    for _ in validator.stream(paths, args.chunksize):
+        pass
+    for name, count in validator.counts.items():
+        if count or name in ('rows', 'valid', 'quarantined'):
+            print(f'{name:<40}{count:>12,}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+"""Dependency-light scoring of exported models with NumPy only.
+
+`export_scorer` turns a fitted encoder, `StandardScaler` and classifier
+(a linear model such as the L1 `LogisticRegression`, or an
+`XGBClassifier`) into a single `.npz` file of plain arrays. XGBoost trees are
+flattened into node arrays (feature, threshold, children, default
+direction for missing values, leaf value) with one root index per tree.
+
+`Scorer` loads that file with nothing but NumPy. It encodes raw records
+through the stored mappings, applies the scaler exactly like
+`StandardScaler.transform`, and scores all trees of a batch of rows at once:
+with per-feature leaf bitmask tables for trees up to depth 6, one tree
+level per vectorized step for deeper ones. Probabilities match
+`predict_proba` of the original model to float32 precision.
+
+Usage:
+    python -m cvd.scorer models/cvd_xgb.joblib models/cvd_xgb.npz
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+SCORER_VERSION = 1
+# Rows scored at a time; bounds the (rows, trees) working matrices.
+BATCH_ROWS = 65536
+# Trees with up to this many leaf slots (depth 6) are scored with leaf bitmasks,
+# deeper ones by walking the nodes level by level.
+MAX_BITMASK_LEAVES = 64
+
+
+def _sigmoid(margin):
+    return 1 / (1 + np.exp(-margin))
+
+
+def _xgb_arrays(model, cover=False):
+    """Flatten the trees of an `XGBClassifier` into node arrays.
+
+    With `cover`, the hessian sum of the training rows reaching every node is
+    included too.
+    """
+    booster = model.get_booster()
+    learner = json.loads(booster.save_raw(raw_format='json'))['learner']
+    objective = learner['objective']['name']
+    if objective != 'binary:logistic':
+        raise ValueError(f'Only binary:logistic boosters can be exported, got {objective}')
+    trees = learner['gradient_booster']['model']['trees']
+    best_iteration = getattr(model, 'best_iteration', None)
+    if best_iteration is not None:
+        trees = trees[:(best_iteration + 1) * int(model.get_params().get('num_parallel_tree') or 1)]
+
+    roots, offset = [], 0
+    names = ('feature', 'threshold', 'left', 'right', 'default_left', 'value') + (('cover',) if cover else ())
+    parts = {name: [] for name in names}
+    for tree in trees:
+        left = np.asarray(tree['left_children'], dtype=np.int32)
+        is_leaf = left < 0
+        conditions = np.asarray(tree['split_conditions'], dtype=np.float32)
+        roots.append(offset)
+        parts['feature'].append(np.where(is_leaf, -1, tree['split_indices']).astype(np.int32))
+        parts['threshold'].append(conditions)
+        parts['left'].append(np.where(is_leaf, -1, left + offset).astype(np.int32))
+        parts['right'].append(np.where(is_leaf, -1, np.asarray(tree['right_children']) + offset).astype(np.int32))
+        parts['default_left'].append(np.asarray(tree['default_left'], dtype=bool))
+        # Leaves store their value in split_conditions.
+        parts['value'].append(np.where(is_leaf, conditions, 0).astype(np.float32))
+        if cover:
+            parts['cover'].append(np.asarray(tree['sum_hessian'], dtype=np.float64))
+        offset += len(left)
+
+    arrays = {name: np.concatenate(values) for name, values in parts.items()}
+    arrays['roots'] = np.asarray(roots, dtype=np.int32)
+    base_score = float(str(learner['learner_model_param']['base_score']).strip('[]'))
+    arrays['base_margin'] = np.float64(np.log(base_score / (1 - base_score)))
+    return arrays
+
+
+def _depth(left, right, roots):
+    """Number of levels of the deepest tree."""
+    depth, nodes = 0, roots
+    while len(nodes):
+        depth += 1
+        nodes = np.concatenate([left[nodes], right[nodes]])
+        nodes = nodes[nodes >= 0]
+    return depth
+
+
+def _leaf_slots(left, right, roots, n_leaves):
+    """Tree number and first leaf slot / number of slots under every node.
+
+    Slots number the leaves left to right as if every tree were complete
+    with `n_leaves` leaves.
+    """
+    lo = np.zeros(len(left), dtype=np.int64)
+    span = np.zeros(len(left), dtype=np.int64)
+    tree = np.zeros(len(left), dtype=np.int64)
+    nodes = roots.astype(np.int64)
+    span[nodes] = n_leaves
+    tree[nodes] = np.arange(len(roots))
+    while len(nodes):
+        nodes = nodes[left[nodes] >= 0]
+        half = span[nodes] // 2
+        for children, offset in ((left[nodes], 0), (right[nodes], half)):
+            lo[children] = lo[nodes] + offset
+            span[children] = half
+            tree[children] = tree[nodes]
+        nodes = np.concatenate([left[nodes], right[nodes]])
+    return lo, span, tree
+
+
+def _bitmask_tables(a, n_leaves, n_features):
+    """Per-feature tables scoring shallow trees with leaf bitmasks.
+
+    Every tree keeps one bit per leaf slot. A failed split test (the row goes
+    right) clears the leaves of its left subtree, and the exit leaf is the
+    lowest bit left set. For each feature, the split nodes are sorted by
+    threshold, and row k of its table holds the masks of every tree after
+    failing the first k tests; the last row holds the masks for a missing
+    value. Scoring a row then takes one search and one AND per feature.
+    """
+    dtype = next(t for t in (np.uint8, np.uint16, np.uint32, np.uint64) if np.dtype(t).itemsize * 8 >= n_leaves)
+    full = int(np.iinfo(dtype).max)
+    lo, span, tree = _leaf_slots(a['left'], a['right'], a['roots'], n_leaves)
+    is_leaf = a['feature'] < 0
+    leaf_values = np.zeros((len(a['roots']), n_leaves), dtype=np.float32)
+    leaf_values[tree[is_leaf], lo[is_leaf]] = a['value'][is_leaf]
+
+    tables = []
+    for f in range(n_features):
+        nodes = np.flatnonzero(a['feature'] == f)
+        if not len(nodes):
+            tables.append(None)
+            continue
+        nodes = nodes[np.argsort(a['threshold'][nodes], kind='stable')]
+        cleared = [~(((1 << int(s // 2)) - 1) << int(slot)) & full for slot, s in zip(lo[nodes], span[nodes])]
+        table = np.full((len(nodes) + 2, len(a['roots'])), full, dtype=dtype)
+        for k, (node, mask) in enumerate(zip(nodes, cleared)):
+            table[k + 1] = table[k]
+            table[k + 1, tree[node]] &= dtype(mask)
+        for node, mask in zip(nodes, cleared):
+            if not a['default_left'][node]:
+                table[-1, tree[node]] &= dtype(mask)
+        tables.append((a['threshold'][nodes], table))
+
+    if n_leaves <= 16:
+        # Index of the lowest set bit of every possible mask.
+        values = np.arange(1, 2 ** (8 * np.dtype(dtype).itemsize))
+        lowest_bit = np.zeros(len(values) + 1, dtype=np.int32)
+        lowest_bit[1:] = np.frexp(values & -values)[1] - 1
+    else:
+        lowest_bit = None
+    return dtype, leaf_values, tables, lowest_bit
+
+
+def _bitmask_margin(X, dtype, leaf_values, tables, lowest_bit):
+    n_trees, n_leaves = leaf_values.shape
+    mask = np.full((len(X), n_trees), np.iinfo(dtype).max, dtype=dtype)
+    for f, feature_table in enumerate(tables):
+        if feature_table is None:
+            continue
+        thresholds, table = feature_table
+        x = X[:, f]
+        k = np.searchsorted(thresholds, x, side='right')
+        k[np.isnan(x)] = len(table) - 1
+        np.bitwise_and(mask, np.take(table, k, axis=0), out=mask)
+    if lowest_bit is not None:
+        leaf = lowest_bit[mask]
+    else:
+        leaf = np.frexp((mask & (~mask + dtype(1))).astype(np.float64))[1] - 1
+    leaf += np.arange(n_trees, dtype=leaf.dtype) * n_leaves
+    return np.take(leaf_values, leaf).sum(axis=1, dtype=np.float32)
+
+
+def _walk_tables(a):
+    """Node arrays for `_walk_margin`; leaves point to themselves."""
+    is_leaf = a['feature'] < 0
+    nodes = np.arange(len(is_leaf), dtype=np.int32)
+    children = np.stack([np.where(is_leaf, nodes, a['left']), np.where(is_leaf, nodes, a['right'])], axis=1)
+    return np.where(is_leaf, 0, a['feature']), a['threshold'], children.ravel(), a['default_left'], a['value']
+
+
+def _walk_margin(X, roots, depth, feature, threshold, children, default_left, value):
+    """Sum of leaf values, walking every tree one level per step."""
+    nodes = np.broadcast_to(roots, (len(X), len(roots))).copy()
+    has_nan = np.isnan(X).any()
+    for _ in range(depth - 1):
+        x = np.take_along_axis(X, feature[nodes], axis=1)
+        go_right = ~(x < threshold[nodes])
+        if has_nan:
+            is_nan = np.isnan(x)
+            go_right[is_nan] = ~default_left[nodes[is_nan]]
+        nodes = children[2 * nodes + go_right]
+    return value[nodes].sum(axis=1, dtype=np.float32)
+
+
+def export_scorer(path, encoder, scaler, model):
+    """Write the arrays scoring `model` on `encoder` + `scaler` features to `path`."""
+    arrays = {}
+    if hasattr(model, 'get_booster'):
+        kind = 'trees'
+        arrays.update(_xgb_arrays(model))
+    elif hasattr(model, 'coef_'):
+        kind = 'linear'
+        arrays['coef'] = np.asarray(model.coef_, dtype=np.float64).ravel()
+        arrays['intercept'] = np.float64(np.ravel(model.intercept_)[0])
+    else:
+        raise ValueError(f'Cannot export {type(model).__name__}; expected a linear model or an XGBClassifier')
+    if scaler is not None:
+        arrays['mean'] = np.asarray(scaler.mean_, dtype=np.float64)
+        arrays['scale'] = np.asarray(scaler.scale_, dtype=np.float64)
+
+    meta = {
+        'version': SCORER_VERSION,
+        'kind': kind,
+        'columns': encoder.columns,
+        'mappings': {col: encoder.schema[col] for col in encoder.columns},
+        'depth': _depth(arrays['left'], arrays['right'], arrays['roots']) if kind == 'trees' else 0,
+    }
+    with open(path, 'wb') as f:
+        np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+
+
+class Scorer:
+    """Heart-disease probabilities from an `export_scorer` file, in pure NumPy."""
+
+    def __init__(self, meta, arrays):
+        self.meta = meta
+        self.arrays = arrays
+        self.columns = meta['columns']
+        self.mappings = meta['mappings']
+        self._bitmask = self._walk = None
+        if meta['kind'] == 'trees':
+            n_leaves = 2 ** (meta['depth'] - 1)
+            if n_leaves <= MAX_BITMASK_LEAVES:
+                self._bitmask = _bitmask_tables(arrays, n_leaves, len(self.columns))
+            else:
+                self._walk = _walk_tables(arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as f:
+            arrays = {name: f[name] for name in f.files}
+        meta = json.loads(str(arrays.pop('meta')))
+        if meta.get('version') != SCORER_VERSION:
+            raise ValueError(f'Unsupported scorer version {meta.get("version")} in {path}')
+        return cls(meta, arrays)
+
+    def encode(self, records):
+        """Encode a list of dicts with the raw survey columns into a float32 matrix."""
+        X = np.empty((len(records), len(self.columns)), dtype=np.float32)
+        for j, col in enumerate(self.columns):
+            mapping = self.mappings[col]
+            try:
+                values = [record[col] if mapping is None else mapping[record[col]] for record in records]
+            except KeyError as e:
+                raise ValueError(f'Cannot encode column {col!r}: missing or unknown value {e}') from None
+            X[:, j] = values
+        return X
+
+    def _scale(self, X):
+        # Same float32 operations as StandardScaler.transform on float32 input.
+        X = np.array(X, dtype=np.float32)
+        if 'mean' in self.arrays:
+            X -= self.arrays['mean'].astype(np.float32)
+            X /= self.arrays['scale'].astype(np.float32)
+        return X
+
+    def _tree_margin(self, X):
+        margin = np.empty(len(X), dtype=np.float64)
+        for start in range(0, len(X), BATCH_ROWS):
+            batch = X[start:start + BATCH_ROWS]
+            if self._bitmask is not None:
+                margin[start:start + len(batch)] = _bitmask_margin(batch, *self._bitmask)
+            else:
+                margin[start:start + len(batch)] = _walk_margin(batch, self.arrays['roots'], self.meta['depth'],
+                                                                *self._walk)
+        return margin + self.arrays['base_margin']
+
+    def predict_proba(self, X):
+        """P(heart disease) of records (list of dicts) or of an encoded feature matrix."""
+        if not isinstance(X, np.ndarray):
+            X = self.encode(X)
+        X = self._scale(X)
+        if self.meta['kind'] == 'trees':
+            return _sigmoid(self._tree_margin(X))
+        return _sigmoid(X.astype(np.float64) @ self.arrays['coef'] + self.arrays['intercept'])
+
+
+def main(argv=None):
+    from cvd import data, synthetic
+    from cvd.serve import RiskModel
+
+    parser = argparse.ArgumentParser(description='Export a model artifact to a NumPy-only scorer.')
+    parser.add_argument('artifact', help='model artifact written by export_model')
+    parser.add_argument('output', help='.npz file to write')
+    parser.add_argument('--check-rows', type=int, default=100000, help='synthetic rows to compare predictions on')
+    args = parser.parse_args(argv)
+
+    risk_model = RiskModel.load(args.artifact)
+    if risk_model.pca is not None:
+        raise ValueError('Models on PCA features cannot be exported')
+    export_scorer(args.output, risk_model.encoder, risk_model.scaler, risk_model.model)
+
+    start = time.perf_counter()
+    scorer = Scorer.load(args.output)
+    load_time = time.perf_counter() - start
+    df = data.clean(synthetic.generate(args.check_rows))
+    X = risk_model.encoder.transform(df)
+    start = time.perf_counter()
+    expected = risk_model.model.predict_proba(risk_model.features(X))[:, 1]
+    reference_time = time.perf_counter() - start
+    start = time.perf_counter()
+    actual = scorer.predict_proba(X)
+    scorer_time = time.perf_counter() - start
+    print(f'Wrote {args.output}: loads in {load_time * 1000:.1f} ms')
+    print(f'{len(X):,} rows: max |difference| {np.abs(actual - expected).max():.2e}, '
+          f'{scorer_time:.3f} s vs {reference_time:.3f} s for predict_proba')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""Parallel, cached hyper-parameter search.
+
+`search` evaluates every point of a parameter grid on a process pool. Each
+(model, params, data fingerprint, rows) result is stored as a small JSON file,
+so interrupted or repeated searches skip the configurations that are already
+done. With `halving=True`, candidates are first fit on subsamples of the
+training set and only the best `1 / factor` of them move on to the next,
+`factor` times larger, subsample.
+"""
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from cvd.metrics import auroc
+
+
+def _logreg(params):
+    from sklearn.linear_model import LogisticRegression
+    l1_ratio = 0.5 if params.get('penalty') == 'elasticnet' else None
+    return LogisticRegression(solver='saga', l1_ratio=l1_ratio, random_state=0, **params)
+
+
+def _tree(params):
+    from sklearn.tree import DecisionTreeClassifier
+    return DecisionTreeClassifier(random_state=0, **params)
+
+
+def _rf(params):
+    from sklearn.ensemble import RandomForestClassifier
+    return RandomForestClassifier(random_state=0, **params)
+
+
+def _xgb(params):
+    import xgboost as xgb
+    return xgb.XGBClassifier(random_state=0, **params)
+
+
+# Model name -> factory taking the grid point. Names rather than estimator
+# objects are passed around so that tasks pickle cheaply and cache keys are
+# stable. Every factory fixes the random state, so a cached result is the
+# one a refit reproduces.
+MODELS = {'logreg': _logreg, 'tree': _tree, 'rf': _rf, 'xgb': _xgb}
+# Bump when a factory changes what a grid point fits, to ignore older results.
+RESULTS_VERSION = 2
+
+
+def make_model(model, params):
+    """Return an unfitted estimator for `model` with `params`."""
+    return MODELS[model](dict(params))
+
+
+def fingerprint(*arrays):
+    """Return a content hash of `arrays` (shapes, dtypes and values)."""
+    digest = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(f'{array.shape}{array.dtype}'.encode())
+        digest.update(array.data)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Directory of JSON results keyed by model, params, data and rows."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def _file(self, model, params, data_key, n_rows):
+        key = json.dumps([RESULTS_VERSION, model, sorted(params.items()), data_key, n_rows], default=str)
+        name = hashlib.sha256(key.encode()).hexdigest()[:32]
+        return os.path.join(self.path, model, name + '.json')
+
+    def get(self, model, params, data_key, n_rows):
+        try:
+            with open(self._file(model, params, data_key, n_rows)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def put(self, model, params, data_key, n_rows, result):
+        path = self._file(model, params, data_key, n_rows)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(result, f)
+        os.replace(tmp, path)
+
+
+def _subsample(n, n_rows, seed):
+    if n_rows is None or n_rows >= n:
+        return None
+    return np.sort(np.random.default_rng(seed).choice(n, n_rows, replace=False))
+
+
+def fit_and_score(model, params, X_train, y_train, X_test, y_test, n_rows=None, seed=0, n_threads=None,
+                  train_auc_rows=None):
+    """Fit one candidate on (a subsample of) the training set and score it.
+
+    Returns a dict with the train and test AUROC and the fit time. With
+    `train_auc_rows`, the train AUROC is estimated on that many randomly
+    chosen training rows instead of scoring the whole training set.
+    """
+    idx = _subsample(len(y_train), n_rows, seed)
+    if idx is not None:
+        X_train, y_train = X_train[idx], y_train[idx]
+    estimator = make_model(model, params)
+    if n_threads is not None and 'n_jobs' in estimator.get_params() and 'n_jobs' not in params:
+        # Avoid oversubscribing the cores when running inside the process pool.
+        estimator.set_params(n_jobs=n_threads)
+    start = time.perf_counter()
+    estimator.fit(X_train, y_train)
+    fit_time = time.perf_counter() - start
+    rows = _subsample(len(y_train), train_auc_rows, seed)
+    X_eval, y_eval = (X_train, y_train) if rows is None else (X_train[rows], y_train[rows])
+    return {
+        'params': dict(params),
+        'train_auc': auroc(y_eval, estimator.predict_proba(X_eval)[:, 1]),
+        'test_auc': auroc(y_test, estimator.predict_proba(X_test)[:, 1]),
+        'fit_time': fit_time,
+        'n_rows': len(y_train),
+    }
+
+
+def _run(model, candidates, data, n_rows, cache, data_key, n_jobs, seed, train_auc_rows):
+    from joblib import Parallel, delayed
+
+    results = [None] * len(candidates)
+    todo = []
+    for i, params in enumerate(candidates):
+        cached = cache.get(model, params, data_key, n_rows) if cache is not None else None
+        if cached is not None:
+            results[i] = dict(cached, cached=True)
+        else:
+            todo.append(i)
+
+    n_threads = 1 if n_jobs != 1 and len(todo) > 1 else None
+    fitted = Parallel(n_jobs=n_jobs)(
+        delayed(fit_and_score)(model, candidates[i], *data, n_rows=n_rows, seed=seed, n_threads=n_threads,
+                               train_auc_rows=train_auc_rows)
+        for i in todo)
+    for i, result in zip(todo, fitted):
+        if cache is not None:
+            cache.put(model, candidates[i], data_key, n_rows, result)
+        results[i] = dict(result, cached=False)
+    return results
+
+
+def _halving_rounds(n_candidates, n, factor, min_rows):
+    """Training rows of each successive-halving round; None is the full set."""
+    rounds = [None]
+    n_rows = n // factor
+    while n_candidates > 1 and n_rows >= min_rows:
+        rounds.insert(0, n_rows)
+        n_rows //= factor
+        n_candidates = -(-n_candidates // factor)
+    return rounds
+
+
+def search(model, param_grid, X_train, y_train, X_test, y_test, cache_dir=None, n_jobs=-1, halving=False,
+           factor=3, min_rows=10000, seed=0, train_auc_rows=None, verbose=True):
+    """Evaluate every point of `param_grid` for `model` (a key of `MODELS`).
+
+    Candidates are spread over `n_jobs` worker processes (all cores by
+    default). Results are cached under `cache_dir` when it is given. Set
+    `train_auc_rows` to estimate the train AUROC on a subsample so that
+    scoring the training set does not dominate the search time. Returns
+    the results of the final round, one dict per candidate that reached it,
+    in grid order.
+    """
+    from sklearn.model_selection import ParameterGrid
+
+    data = tuple(np.asarray(a) for a in (X_train, y_train, X_test, y_test))
+    data_key = fingerprint(*data)
+    if train_auc_rows is not None:
+        data_key += f'-train{train_auc_rows}'
+    cache = ResultCache(cache_dir) if cache_dir is not None else None
+    candidates = list(ParameterGrid(param_grid))
+
+    rounds = _halving_rounds(len(candidates), len(data[1]), factor, min_rows) if halving else [None]
+    for n_rows in rounds:
+        results = _run(model, candidates, data, n_rows, cache, data_key, n_jobs, seed, train_auc_rows)
+        if verbose:
+            for result in results:
+                rows = '' if n_rows is None else f" ({result['n_rows']} rows)"
+                print(f"Hyperparameters: {result['params']}{rows}, Train AUROC: {result['train_auc']}, "
+                      f"Test AUROC: {result['test_auc']}")
+        if n_rows is not None:
+            keep = -(-len(candidates) // factor)
+            order = np.argsort([-r['test_auc'] for r in results], kind='stable')[:keep]
+            candidates = [candidates[i] for i in sorted(order)]
+    return results
+
+
+def best_result(results, key='test_auc'):
+    """Return the result with the highest `key` (test AUROC by default)."""
+    return max(results, key=lambda r: r[key])
@@ -0,0 +1,281 @@
+"""Batch and streaming scoring of survey records with the final risk model.
+
+The fitted encoder, scaler and classifier are exported together as one
+artifact. The scoring server micro-batches incoming records into vectorized
+`predict_proba` calls and keeps latency and throughput metrics.
+
+Usage:
+    python -m cvd.serve models/cvd_xgb.joblib --stdin < records.jsonl
+    python -m cvd.serve models/cvd_xgb.joblib --port 8000
+
+In stdin mode every input line is a JSON record and every output line the
+matching JSON result. In HTTP mode POST /predict accepts a record or a list
+of records, and GET /metrics returns the metrics.
+"""
+import argparse
+import collections
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+ARTIFACT_VERSION = 1
+
+
+def export_model(path, encoder, scaler, model, pca=None, **extra):
+    """Save the fitted encoder, scaler, optional PCA and classifier as one artifact.
+
+    Any `extra` keyword arguments are stored alongside and ignored by `RiskModel`.
+    """
+    import joblib
+
+    if scaler is not None and hasattr(scaler, 'feature_names_in_') \
+            and list(scaler.feature_names_in_) != encoder.feature_names:
+        raise ValueError(f'Scaler was fit on {list(scaler.feature_names_in_)}, '
+                         f'encoder produces {encoder.feature_names}')
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    joblib.dump(dict(extra, version=ARTIFACT_VERSION, encoder=encoder, scaler=scaler, pca=pca, model=model), path)
+
+
+class RiskModel:
+    """Encoder + scaler + (PCA) + classifier loaded from an exported artifact."""
+
+    def __init__(self, encoder, scaler, model, pca=None):
+        self.encoder = encoder
+        self.scaler = scaler
+        self.model = model
+        self.pca = pca
+
+    @classmethod
+    def load(cls, path):
+        import joblib
+
+        artifact = joblib.load(path)
+        if artifact.get('version') != ARTIFACT_VERSION:
+            raise ValueError(f'Unsupported artifact version {artifact.get("version")} in {path}')
+        return cls(artifact['encoder'], artifact['scaler'], artifact['model'], artifact.get('pca'))
+
+    def predict_proba(self, records):
+        """Return the heart-disease probability of each record.
+
+        `records` is a DataFrame or a list of dicts with the raw survey
+        columns used by the encoder.
+        """
+        import pandas as pd
+
+        df = records if isinstance(records, pd.DataFrame) else pd.DataFrame.from_records(records)
+        return self.model.predict_proba(self.features(self.encoder.transform(df)))[:, 1]
+
+    def features(self, X):
+        """Scale (and project) an encoded feature matrix into model inputs.
+
+        The scaler gets a DataFrame if it was fitted on one and an array
+        otherwise, as `cvd.pipeline` fits it, so neither warns about feature names.
+        """
+        if self.scaler is None or hasattr(self.scaler, 'feature_names_in_'):
+            X = self.encoder.to_frame(X)
+        else:
+            X = np.asarray(X)
+        if self.scaler is not None:
+            X = self.scaler.transform(X)
+        if self.pca is not None:
+            X = self.pca.transform(X)
+        return X
+
+
+class Metrics:
+    """Latency percentiles and throughput over the most recent requests."""
+
+    def __init__(self, window=10000):
+        self.latencies = collections.deque(maxlen=window)
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.records = 0
+        self.batches = 0
+
+    def add_batch(self, latencies):
+        with self.lock:
+            self.latencies.extend(latencies)
+            self.records += len(latencies)
+            self.batches += 1
+
+    def snapshot(self):
+        with self.lock:
+            latencies = np.fromiter(self.latencies, dtype=float)
+            records, batches = self.records, self.batches
+        elapsed = time.perf_counter() - self.start
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000 if len(latencies) else (0.0, 0.0)
+        return {
+            'records': records,
+            'batches': batches,
+            'mean_batch_size': records / batches if batches else 0.0,
+            'throughput_per_s': records / elapsed if elapsed > 0 else 0.0,
+            'latency_p50_ms': float(p50),
+            'latency_p99_ms': float(p99),
+        }
+
+
+class MicroBatcher:
+    """Collects single records from many callers into vectorized batches.
+
+    A background thread waits for the first pending record, then for up to
+    `max_wait` seconds or until `max_batch` records are pending, and scores
+    them in one call.
+    """
+
+    def __init__(self, risk_model, max_batch=1024, max_wait=0.005, metrics=None):
+        self.risk_model = risk_model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.pending = queue.Queue()
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def submit(self, record):
+        """Queue one record; returns a Future resolving to its probability."""
+        future = Future()
+        self.pending.put((record, future, time.perf_counter()))
+        return future
+
+    def predict(self, records):
+        return [future.result() for future in [self.submit(record) for record in records]]
+
+    def _loop(self):
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._score(batch)
+
+    def _score(self, batch):
+        records, futures, submitted = zip(*batch)
+        try:
+            probas = self.risk_model.predict_proba(list(records))
+        except Exception as e:
+            if len(batch) > 1:
+                # Score one by one so that a bad record only fails its own request.
+                for item in batch:
+                    self._score([item])
+            else:
+                futures[0].set_exception(e)
+            return
+        done = time.perf_counter()
+        for future, proba in zip(futures, probas):
+            future.set_result(float(proba))
+        self.metrics.add_batch([done - t for t in submitted])
+
+
+def serve_stdin(batcher, stdin=sys.stdin, stdout=sys.stdout):
+    """Score JSON-lines records from `stdin`, writing results in input order."""
+    results = queue.Queue()
+
+    def write():
+        while True:
+            future = results.get()
+            if future is None:
+                break
+            try:
+                line = json.dumps({'probability': future.result()})
+            except Exception as e:
+                line = json.dumps({'error': str(e)})
+            stdout.write(line + '\n')
+        stdout.flush()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        for line in stdin:
+            if line.strip():
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    # A malformed line gets an error result in its place instead of ending the stream.
+                    future = Future()
+                    future.set_exception(e)
+                    results.put(future)
+                    continue
+                results.put(batcher.submit(record))
+    finally:
+        results.put(None)
+        writer.join()
+    print(json.dumps(batcher.metrics.snapshot()), file=sys.stderr)
+
+
+def serve_http(batcher, host='127.0.0.1', port=8000):
+    """Serve POST /predict and GET /metrics until interrupted."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path == '/metrics':
+                self._reply(200, batcher.metrics.snapshot())
+            else:
+                self._reply(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path != '/predict':
+                self._reply(404, {'error': 'not found'})
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                if isinstance(body, dict):
+                    self._reply(200, {'probability': batcher.submit(body).result()})
+                elif isinstance(body, list) and all(isinstance(record, dict) for record in body):
+                    self._reply(200, {'probabilities': batcher.predict(body)})
+                else:
+                    self._reply(400, {'error': 'expected a JSON record or a list of records'})
+            except (ValueError, KeyError, TypeError) as e:
+                self._reply(400, {'error': str(e)})
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('artifact', help='model artifact written by export_model')
+    parser.add_argument('--stdin', action='store_true', help='score JSON lines from stdin instead of serving HTTP')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-batch', type=int, default=1024)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    batcher = MicroBatcher(RiskModel.load(args.artifact), args.max_batch, args.max_wait_ms / 1000)
+    if args.stdin:
+        serve_stdin(batcher)
+    else:
+        serve_http(batcher, args.host, args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Compact, dtype-aware storage of the encoded features.
+
+`FeatureStore` keeps each feature column in the smallest dtype that holds
+it: uint8 for the 0/1 flags, uint8 level codes plus a lookup table for
+multi-level codes such as Age_Category, and float32 for continuous columns.
+Models still get a dense float32 matrix from `dense`, which can be scaled in
+place with `standardize_`. `memory_report` prints the size of each stage.
+"""
+import numpy as np
+import pandas as pd
+
+from cvd.encoding import MODEL_COLUMNS, SCHEMA, _codes
+
+
+class FeatureStore:
+    """Column-wise compact storage of encoded features."""
+
+    def __init__(self, names, columns, tables):
+        self.names = list(names)
+        self.columns = columns
+        # Per-column float32 lookup table for level codes, None for columns
+        # stored with their final values.
+        self.tables = tables
+
+    @classmethod
+    def from_frame(cls, df, columns=MODEL_COLUMNS, schema=SCHEMA):
+        """Encode the raw columns `columns` of `df` according to `schema`."""
+        names, arrays, tables = [], [], []
+        for col in columns:
+            mapping = schema[col]
+            if mapping is None:
+                names.append(col)
+                arrays.append(df[col].to_numpy(dtype=np.float32))
+                tables.append(None)
+                continue
+            codes = _codes(df[col], list(mapping))
+            if (codes < 0).any():
+                unknown = pd.unique(df[col][codes < 0].astype(object))
+                raise ValueError(f'Cannot encode values of column {col!r}: {list(unknown)}')
+            table = np.asarray(list(mapping.values()), dtype=np.float32)
+            names.append(col + '_Encoded')
+            if set(table) <= {0, 1}:
+                arrays.append(table.astype(np.uint8)[codes])
+                tables.append(None)
+            else:
+                arrays.append(codes.astype(np.uint8))
+                tables.append(table)
+        return cls(names, arrays, tables)
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    @property
+    def nbytes(self):
+        return sum(col.nbytes for col in self.columns)
+
+    def take(self, rows):
+        """Return a new store holding only `rows`."""
+        return FeatureStore(self.names, [col[rows] for col in self.columns], self.tables)
+
+    def dense(self, rows=None, out=None):
+        """Materialize a float32 (n_rows, n_features) matrix, optionally into `out`."""
+        n = len(self) if rows is None else len(rows)
+        if out is None:
+            out = np.empty((n, len(self.columns)), dtype=np.float32)
+        for j, (col, table) in enumerate(zip(self.columns, self.tables)):
+            values = col if rows is None else col[rows]
+            out[:, j] = values if table is None else table[values]
+        return out
+
+    def to_frame(self, rows=None):
+        return pd.DataFrame(self.dense(rows), columns=self.names, copy=False)
+
+
+def standardize_(X, scaler):
+    """Scale `X` in place with a fitted StandardScaler and return it."""
+    if scaler.with_mean:
+        X -= scaler.mean_.astype(X.dtype)
+    if scaler.with_std:
+        X /= scaler.scale_.astype(X.dtype)
+    return X
+
+
+def nbytes(obj):
+    """Memory used by an array, DataFrame, FeatureStore or a sequence of them."""
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        usage = obj.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(obj, pd.DataFrame) else usage)
+    if isinstance(obj, (list, tuple)):
+        return sum(nbytes(item) for item in obj)
+    return int(obj.nbytes)
+
+
+def memory_report(**stages):
+    """Print and return the memory used by each named stage, in bytes."""
+    sizes = {name: nbytes(obj) for name, obj in stages.items()}
+    for name, size in sizes.items():
+        print(f'{name:<24}{size / 2 ** 20:>10.1f} MB')
+    print(f'{"total":<24}{sum(sizes.values()) / 2 ** 20:>10.1f} MB')
+    return sizes
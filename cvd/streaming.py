@@ -0,0 +1,216 @@
+"""Out-of-core training on survey CSVs larger than memory.
+
+`StreamingPipeline` reads the CSV in chunks, cleans and encodes each chunk,
+fits the `StandardScaler` with `partial_fit` and the optional
+`IncrementalPCA` on the scaled chunks, and trains either an SGD logistic
+regression or an XGBoost booster on top of an external-memory iterator.
+Only one chunk is held in memory at a time, and the test AUROC is computed
+from fixed-size score histograms, so peak memory does not grow with the
+input. Rows failing `cvd.schema.RULES` are skipped, and written to the
+`quarantine` CSV when one is given. With `dedupe=True`, rows repeated
+within or across the files are dropped on every pass with a
+`cvd.dedupe.Deduplicator`, which holds 8 bytes per unique row.
+
+Usage:
+    python -m cvd.streaming brfss_*.csv --model xgb --chunksize 200000 --output models/streaming_xgb.joblib
+    python -m cvd.streaming brfss_*.csv --model sgd --dedupe
+"""
+import argparse
+import glob
+import tempfile
+
+import numpy as np
+
+from cvd import data
+from cvd.dedupe import Deduplicator
+from cvd.encoding import MODEL_COLUMNS, TARGET, Encoder
+from cvd.schema import Validator
+
+AUC_BINS = 10000
+
+
+def binned_auc(pos_hist, neg_hist):
+    """AUROC from histograms of the positive and negative scores.
+
+    Scores falling into the same bin count as ties, so the result is within
+    1 / len(bins) of the exact AUROC.
+    """
+    neg_below = np.cumsum(neg_hist) - neg_hist
+    return float((pos_hist * (neg_below + 0.5 * neg_hist)).sum() / (pos_hist.sum() * neg_hist.sum()))
+
+
+class StreamingPipeline:
+    """Chunked clean -> encode -> scale -> (PCA) pipeline over CSV files.
+
+    Each row is assigned to the test split with probability `test_size`,
+    using a random stream seeded by `seed` and the chunk number, so every
+    pass over the files sees the same split.
+    """
+
+    def __init__(self, paths, chunksize=100000, test_size=0.2, seed=42, n_components=None, dedupe=False,
+                 quarantine=None):
+        self.paths = [paths] if isinstance(paths, str) else list(paths)
+        self.chunksize = chunksize
+        self.test_size = test_size
+        self.seed = seed
+        self.n_components = n_components
+        self.dedupe = dedupe
+        self.quarantine = quarantine
+        self.validation = None
+        self.encoder = Encoder(MODEL_COLUMNS)
+        self.scaler = None
+        self.pca = None
+
+    def _raw_chunks(self):
+        # A fresh validator and set per pass, so that every pass keeps the same
+        # rows; each pass rewrites the same quarantine file.
+        validator = Validator(quarantine=self.quarantine)
+        self.validation = validator.counts
+        dedupe = Deduplicator() if self.dedupe else None
+        for i, (path, chunk) in enumerate(validator.stream(self.paths, self.chunksize)):
+            chunk = data.clean(chunk)
+            yield i, dedupe.filter(chunk, path) if dedupe is not None else chunk
+
+    def chunks(self, part='train', transform=True):
+        """Yield (X, y) float32/int8 arrays of the `part` ('train' or 'test') rows.
+
+        With `transform=False` the encoded features are yielded unscaled.
+        """
+        for i, chunk in self._raw_chunks():
+            if not len(chunk):
+                continue
+            is_test = np.random.default_rng([self.seed, i]).random(len(chunk)) < self.test_size
+            mask = is_test if part == 'test' else ~is_test
+            chunk = chunk[mask]
+            X = self.encoder.transform(chunk)
+            y = (chunk[TARGET] == 'Yes').to_numpy(dtype=np.int8)
+            yield (self.transform(X) if transform else X), y
+
+    def transform(self, X):
+        """Scale (and project, when PCA is fitted) encoded features."""
+        X = self.scaler.transform(X).astype(np.float32, copy=False)
+        if self.pca is not None:
+            X = self.pca.transform(X).astype(np.float32, copy=False)
+        return X
+
+    def fit_preprocessing(self):
+        """Fit the scaler in one pass, then the PCA (if any) in a second pass."""
+        from sklearn.preprocessing import StandardScaler
+
+        self.scaler = StandardScaler()
+        for X, _ in self.chunks(transform=False):
+            self.scaler.partial_fit(X)
+        self.pca = None
+        if self.n_components:
+            from sklearn.decomposition import IncrementalPCA
+
+            pca = IncrementalPCA(n_components=self.n_components)
+            for X, _ in self.chunks():
+                # partial_fit needs at least n_components rows per batch.
+                if len(X) >= self.n_components:
+                    pca.partial_fit(X)
+            self.pca = pca
+        return self
+
+    def fit_sgd(self, n_epochs=1, **params):
+        """Train an SGD logistic regression with one partial_fit per chunk."""
+        from sklearn.linear_model import SGDClassifier
+
+        params.setdefault('loss', 'log_loss')
+        model = SGDClassifier(**params)
+        for _ in range(n_epochs):
+            for X, y in self.chunks():
+                model.partial_fit(X, y, classes=[0, 1])
+        return model
+
+    def fit_xgb(self, params=None, num_boost_round=100, cache_dir=None):
+        """Train an XGBoost booster from an external-memory chunk iterator.
+
+        The quantized pages are cached under `cache_dir` (a temporary
+        directory by default) instead of being held in memory.
+        """
+        import xgboost as xgb
+
+        pipeline = self
+
+        class ChunkIter(xgb.DataIter):
+            def __init__(self, cache_prefix):
+                super().__init__(cache_prefix=cache_prefix)
+                self._chunks = None
+
+            def next(self, input_data):
+                if self._chunks is None:
+                    self._chunks = pipeline.chunks()
+                try:
+                    X, y = next(self._chunks)
+                except StopIteration:
+                    return False
+                input_data(data=X, label=y)
+                return True
+
+            def reset(self):
+                self._chunks = None
+
+        params = dict({'objective': 'binary:logistic', 'eta': 0.2, 'gamma': 1, 'max_depth': 4,
+                       'tree_method': 'hist'}, **(params or {}))
+        with tempfile.TemporaryDirectory(dir=cache_dir) as tmp:
+            it = ChunkIter(cache_prefix=f'{tmp}/cvd')
+            # ExtMemQuantileDMatrix is the external-memory format of XGBoost >= 3.0.
+            if hasattr(xgb, 'ExtMemQuantileDMatrix'):
+                dtrain = xgb.ExtMemQuantileDMatrix(it)
+            else:
+                dtrain = xgb.DMatrix(it)
+            booster = xgb.train(params, dtrain, num_boost_round=num_boost_round)
+            # Release the cache pages before their directory is removed.
+            del dtrain, it
+        return booster
+
+    def evaluate(self, predict_proba, bins=AUC_BINS):
+        """Return the test AUROC of `predict_proba` (features -> P(y = 1))."""
+        pos_hist = np.zeros(bins, dtype=np.int64)
+        neg_hist = np.zeros(bins, dtype=np.int64)
+        for X, y in self.chunks('test'):
+            idx = np.minimum((predict_proba(X) * bins).astype(np.int64), bins - 1)
+            pos_hist += np.bincount(idx[y == 1], minlength=bins)
+            neg_hist += np.bincount(idx[y == 0], minlength=bins)
+        return binned_auc(pos_hist, neg_hist)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train a CVD risk model out of core.')
+    parser.add_argument('paths', nargs='+', help='CSV files (globs allowed) shaped like CVD_cleaned.csv')
+    parser.add_argument('--model', choices=['sgd', 'xgb'], default='xgb')
+    parser.add_argument('--chunksize', type=int, default=100000)
+    parser.add_argument('--n-components', type=int, default=None, help='fit an IncrementalPCA first')
+    parser.add_argument('--rounds', type=int, default=100, help='XGBoost boosting rounds')
+    parser.add_argument('--epochs', type=int, default=1, help='SGD passes over the data')
+    parser.add_argument('--dedupe', action='store_true', help='drop rows repeated within or across the files')
+    parser.add_argument('--quarantine', help='CSV to write rows failing validation to, with the reasons')
+    parser.add_argument('--output', help='model artifact to write with cvd.serve.export_model')
+    args = parser.parse_args(argv)
+
+    paths = [path for pattern in args.paths for path in sorted(glob.glob(pattern)) or [pattern]]
+    pipeline = StreamingPipeline(paths, args.chunksize, n_components=args.n_components,
+                                 dedupe=args.dedupe, quarantine=args.quarantine).fit_preprocessing()
+    if args.model == 'xgb':
+        import xgboost as xgb
+
+        model = pipeline.fit_xgb(num_boost_round=args.rounds)
+        auc = pipeline.evaluate(lambda X: model.predict(xgb.DMatrix(X)))
+    else:
+        model = pipeline.fit_sgd(n_epochs=args.epochs)
+        auc = pipeline.evaluate(lambda X: model.predict_proba(X)[:, 1])
+    print(f"Test AUROC: {auc:.4f} ({pipeline.validation['quarantined']:,} of {pipeline.validation['rows']:,} rows "
+          f"quarantined)")
+    if args.output:
+        from cvd.serve import export_model
+
+        if args.model == 'xgb':
+            # Wrap the booster so the artifact has predict_proba, like the other exported models.
+            booster, model = model, xgb.XGBClassifier()
+            model.load_model(booster.save_raw('ubj'))
+        export_model(args.output, pipeline.encoder, pipeline.scaler, model, pca=pipeline.pca)
+
+
+if __name__ == '__main__':
+    main()
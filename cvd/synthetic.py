@@ -0,0 +1,148 @@
+"""Synthetic survey rows with the schema of CVD_cleaned.csv, for scale testing.
+
+`generate` draws any number of rows with the same columns and category
+levels as CVD_cleaned.csv. The marginal distributions roughly follow the
+real extract: the category shares below, the numeric means and spreads
+shown by `describe()` in the notebook, and a Heart_Disease rate of about 8%
+that rises with age like in the real data. Rows are drawn independently and
+fully vectorized; every chunk has its own seeded random stream, so output is
+reproducible for a given seed and chunk size.
+
+Usage:
+    python -m cvd.synthetic brfss_10m.csv --rows 10000000
+    python -m cvd.synthetic brfss_10m.parquet --rows 10000000 --format parquet
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from cvd import data
+
+# Approximate shares of each level in CVD_cleaned.csv, in CATEGORIES order.
+SHARES = {
+    'General_Health': [0.039, 0.116, 0.309, 0.356, 0.180],
+    'Checkup': [0.775, 0.111, 0.061, 0.048, 0.005],
+    'Exercise': [0.225, 0.775],
+    'Skin_Cancer': [0.903, 0.097],
+    'Other_Cancer': [0.903, 0.097],
+    'Depression': [0.800, 0.200],
+    'Diabetes': [0.838855, 0.130211, 0.022356, 0.008578],
+    'Arthritis': [0.673, 0.327],
+    'Sex': [0.519, 0.481],
+    'Age_Category': [0.061, 0.051, 0.058, 0.066, 0.071, 0.068, 0.079, 0.089, 0.105, 0.107, 0.097, 0.067, 0.081],
+    'Smoking_History': [0.594, 0.406],
+}
+
+# (mean, standard deviation, max) of the consumption columns, drawn from a
+# negative binomial with that mean and spread and clipped to the max.
+CONSUMPTION = {
+    'Alcohol_Consumption': (5.10, 8.20, 30),
+    'Fruit_Consumption': (29.84, 24.88, 120),
+    'Green_Vegetables_Consumption': (15.11, 14.93, 128),
+    'FriedPotato_Consumption': (6.30, 8.58, 128),
+}
+
+HEART_DISEASE_RATE = 0.08
+# Log-odds of Heart_Disease per age bin and for the strongest risk factors.
+AGE_LOG_ODDS = 0.28
+RISK_LOG_ODDS = {'Sex': ('Male', 0.6), 'Diabetes': ('Yes', 0.8), 'Smoking_History': ('Yes', 0.4),
+                 'Arthritis': ('Yes', 0.4), 'Exercise': ('No', 0.3)}
+
+
+def _categorical(rng, col, n):
+    dtype = data.CATEGORIES[col]
+    p = np.asarray(SHARES[col])
+    return pd.Categorical.from_codes(rng.choice(len(p), n, p=p / p.sum()), dtype=dtype)
+
+
+def _consumption(rng, mean, std, high, n):
+    r = mean ** 2 / (std ** 2 - mean)
+    return np.minimum(rng.negative_binomial(r, r / (r + mean), n), high).astype(float)
+
+
+def _log_odds(df):
+    log_odds = AGE_LOG_ODDS * df['Age_Category'].cat.codes.to_numpy()
+    for col, (level, weight) in RISK_LOG_ODDS.items():
+        log_odds = log_odds + weight * (df[col] == level).to_numpy()
+    return log_odds
+
+
+def _intercept(log_odds, rate):
+    """Intercept that makes the mean predicted probability equal `rate`."""
+    low, high = -20.0, 20.0
+    for _ in range(50):
+        mid = (low + high) / 2
+        if np.mean(1 / (1 + np.exp(-(log_odds + mid)))) > rate:
+            high = mid
+        else:
+            low = mid
+    return (low + high) / 2
+
+
+def generate(n, seed=0):
+    """Return `n` synthetic rows as a DataFrame shaped like CVD_cleaned.csv."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({col: _categorical(rng, col, n) for col in SHARES})
+
+    male = (df['Sex'] == 'Male').to_numpy()
+    height = np.where(male, rng.normal(177.9, 7.6, n), rng.normal(163.7, 7.1, n))
+    df['Height_(cm)'] = np.clip(height, 91, 241).round()
+    # Log-normal weight with mean ~83.6 kg and standard deviation ~21.3 kg.
+    weight = np.exp(rng.normal(np.where(male, 4.48, 4.30), 0.23, n))
+    df['Weight_(kg)'] = np.clip(weight, 24.95, 293.02).round(2)
+    df['BMI'] = (df['Weight_(kg)'] / (df['Height_(cm)'] / 100) ** 2).round(2)
+    for col, (mean, std, high) in CONSUMPTION.items():
+        df[col] = _consumption(rng, mean, std, high, n)
+
+    log_odds = _log_odds(df)
+    p = 1 / (1 + np.exp(-(log_odds + _intercept(log_odds, HEART_DISEASE_RATE))))
+    df['Heart_Disease'] = pd.Categorical.from_codes((rng.random(n) < p).astype(np.int8),
+                                                    dtype=data.CATEGORIES['Heart_Disease'])
+    return df[data.COLUMNS]
+
+
+def generate_chunks(n, chunk_rows=1000000, seed=0):
+    """Yield DataFrames of at most `chunk_rows` rows, `n` rows in total."""
+    for i, start in enumerate(range(0, n, chunk_rows)):
+        yield generate(min(chunk_rows, n - start), seed=[seed, i])
+
+
+def write_csv(path, n, chunk_rows=1000000, seed=0):
+    """Write `n` synthetic rows to a CSV file, one chunk at a time."""
+    for i, chunk in enumerate(generate_chunks(n, chunk_rows, seed)):
+        chunk.to_csv(path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+
+
+def write_parquet(path, n, chunk_rows=1000000, seed=0):
+    """Write `n` synthetic rows to a Parquet file with one row group per chunk."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for chunk in generate_chunks(n, chunk_rows, seed):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate synthetic CVD_cleaned.csv-shaped data.')
+    parser.add_argument('output')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--chunk-rows', type=int, default=1000000)
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    write = write_csv if args.format == 'csv' else write_parquet
+    write(args.output, args.rows, args.chunk_rows, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""Depth and cost-complexity sweeps of a decision tree grown once.
+
+The notebook's depth curve fits a new `DecisionTreeClassifier` for every
+`max_depth` and predicts both splits each time. A depth-first tree limited
+to depth d is the unlimited tree with every node at depth d turned into a
+leaf, and a tree pruned with `ccp_alpha` is the unlimited tree with the
+weakest-link subtrees collapsed. `TreeSweep` therefore grows the deepest
+tree once, routes every row to its leaf once with `apply`, and evaluates
+each depth or alpha by mapping the leaves onto their surviving ancestor,
+which is an index lookup per row. Internal nodes keep their class
+fractions, so the ancestor's fraction is exactly the probability the
+shallower tree would predict.
+
+Pruning gives the same trees as refitting with `ccp_alpha`. Limiting the
+depth gives a tree with the same training impurity as refitting with
+`max_depth`, but splits that improve the impurity equally may be broken
+differently: scikit-learn shuffles the candidate features of each node
+with the random state, which a tree with fewer nodes consumes in a
+different order. The trees agree near the root, but deep ones can end up
+with noticeably different leaves: at depth 15 on 100,000 synthetic rows
+the test AUROC is 0.6039 for the sweep against 0.5990 for the refit. The
+sweep is for choosing a depth; `refit` fits the tree that is reported.
+
+Usage:
+    python -m cvd.treesweep --rows 300000
+    python -m cvd.treesweep --csv CVD_cleaned.csv --alphas 1e-5 1e-4 1e-3
+"""
+import argparse
+import time
+
+import numpy as np
+
+from cvd.metrics import auroc
+
+DEPTHS = (1, 3, 5, 10, 15, 20, None)
+
+
+class TreeSweep:
+    """A `DecisionTreeClassifier` grown once and evaluated at any `max_depth` or `ccp_alpha`.
+
+    `params` are passed to the classifier, except `max_depth` and
+    `ccp_alpha`, which are what the sweep varies.
+    """
+
+    def __init__(self, random_state=0, **params):
+        if 'max_depth' in params or 'ccp_alpha' in params:
+            raise ValueError('TreeSweep grows the unlimited tree; pass max_depth and ccp_alpha to the sweep')
+        self.random_state = random_state
+        self.params = params
+
+    def fit(self, X, y):
+        from sklearn.tree import DecisionTreeClassifier
+
+        start = time.perf_counter()
+        self.estimator_ = DecisionTreeClassifier(random_state=self.random_state, **self.params).fit(X, y)
+        self.fit_time_ = time.perf_counter() - start
+        tree = self.estimator_.tree_
+        self.is_leaf_ = tree.children_left < 0
+        self.parent_ = np.zeros(tree.node_count, dtype=np.intp)
+        internal = np.flatnonzero(~self.is_leaf_)
+        self.parent_[tree.children_left[internal]] = internal
+        self.parent_[tree.children_right[internal]] = internal
+        # Children are numbered after their parent, so one pass in node order gives every depth.
+        self.depth_ = np.zeros(tree.node_count, dtype=np.intp)
+        for node in range(1, tree.node_count):
+            self.depth_[node] = self.depth_[self.parent_[node]] + 1
+        self.levels_ = [np.flatnonzero(self.depth_ == level) for level in range(self.depth_.max() + 1)]
+        value = tree.value[:, 0, :]
+        self.proba_ = value[:, 1] / value.sum(axis=1)
+        # Weighted impurity of each node as a fraction of the root's samples, as in minimal cost-complexity pruning.
+        self.risk_ = tree.impurity * tree.weighted_n_node_samples / tree.weighted_n_node_samples[0]
+        return self
+
+    def _pruned_leaves(self, max_depth=None, ccp_alpha=0.0):
+        """Mask of the nodes that are leaves after limiting the depth and pruning."""
+        tree = self.estimator_.tree_
+        leaves = self.is_leaf_.copy()
+        if max_depth is not None:
+            leaves |= self.depth_ == max_depth
+        if ccp_alpha > 0:
+            # Bottom-up: collapse a node when, as a leaf, it costs no more than its best subtree.
+            cost = self.risk_ + ccp_alpha
+            for nodes in reversed(self.levels_):
+                nodes = nodes[~self.is_leaf_[nodes]]
+                subtree = cost[tree.children_left[nodes]] + cost[tree.children_right[nodes]]
+                collapse = self.risk_[nodes] + ccp_alpha <= subtree
+                leaves[nodes[collapse]] = True
+                cost[nodes] = np.minimum(cost[nodes], subtree)
+        return leaves
+
+    def _surviving_ancestors(self, leaves):
+        top = np.arange(len(leaves))
+        for nodes in self.levels_[1:]:
+            parents = self.parent_[nodes]
+            cut = (top[parents] != parents) | leaves[parents]
+            top[nodes] = np.where(cut, top[parents], nodes)
+        return top
+
+    def node_map(self, max_depth=None, ccp_alpha=0.0):
+        """For every node of the grown tree, the node that is its leaf in the limited or pruned tree."""
+        return self._surviving_ancestors(self._pruned_leaves(max_depth, ccp_alpha))
+
+    def predict_proba(self, X, max_depth=None, ccp_alpha=0.0):
+        """Positive-class probability of the limited or pruned tree."""
+        return self.proba_[self.node_map(max_depth, ccp_alpha)[self.estimator_.apply(X)]]
+
+    def n_leaves(self, max_depth=None, ccp_alpha=0.0):
+        leaves = self._pruned_leaves(max_depth, ccp_alpha)
+        return int((leaves & (self._surviving_ancestors(leaves) == np.arange(len(leaves)))).sum())
+
+    def feature_importances(self, ccp_alpha=0.0):
+        """Normalized impurity decrease per feature of the pruned tree (`feature_importances_`).
+
+        Only pruning gives the refitted tree exactly; for a depth-limited
+        tree use `refit(X, y, max_depth=d).feature_importances_`.
+        """
+        tree = self.estimator_.tree_
+        leaves = self._pruned_leaves(ccp_alpha=ccp_alpha)
+        kept = self._surviving_ancestors(leaves) == np.arange(len(leaves))
+        split = np.flatnonzero(kept & ~leaves)
+        w, impurity = tree.weighted_n_node_samples, tree.impurity
+        left, right = tree.children_left[split], tree.children_right[split]
+        decrease = w[split] * impurity[split] - w[left] * impurity[left] - w[right] * impurity[right]
+        importances = np.bincount(tree.feature[split], weights=decrease, minlength=tree.n_features)
+        total = importances.sum()
+        return importances / total if total > 0 else importances
+
+    def refit(self, X, y, max_depth=None, ccp_alpha=0.0):
+        """Fit the `DecisionTreeClassifier` the sweep approximates at `max_depth` and `ccp_alpha`."""
+        from sklearn.tree import DecisionTreeClassifier
+
+        return DecisionTreeClassifier(random_state=self.random_state, max_depth=max_depth, ccp_alpha=ccp_alpha,
+                                      **self.params).fit(X, y)
+
+    def sweep(self, X_train, y_train, X_test, y_test, depths=DEPTHS, ccp_alphas=()):
+        """Train and test AUROC at each depth and each alpha, from one `apply` of each split.
+
+        Returns one `cvd.search.search`-style result per setting, depths
+        first, with `params` {'max_depth': d} or {'ccp_alpha': alpha}.
+        """
+        leaves = {'train': self.estimator_.apply(X_train), 'test': self.estimator_.apply(X_test)}
+        settings = [{'max_depth': d} for d in depths] + [{'ccp_alpha': float(a)} for a in ccp_alphas]
+        results = []
+        for params in settings:
+            node_map = self.node_map(**params)
+            results.append({
+                'params': params,
+                'train_auc': auroc(y_train, self.proba_[node_map[leaves['train']]]),
+                'test_auc': auroc(y_test, self.proba_[node_map[leaves['test']]]),
+                'n_leaves': self.n_leaves(**params),
+                'n_rows': len(y_train),
+            })
+        return results
+
+
+def main(argv=None):
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import StandardScaler
+
+    from cvd import data, synthetic
+    from cvd.encoding import MODEL_COLUMNS, TARGET, Encoder
+    from cvd.search import fit_and_score
+
+    parser = argparse.ArgumentParser(description='Compare the one-tree sweep with refitting a tree per depth.')
+    parser.add_argument('--csv', help='CSV shaped like CVD_cleaned.csv (default: synthetic rows)')
+    parser.add_argument('--rows', type=int, default=300000, help='synthetic rows when no --csv is given')
+    parser.add_argument('--alphas', type=float, nargs='*', default=[], help='ccp_alpha values to sweep as well')
+    args = parser.parse_args(argv)
+
+    df = data.read_csv(args.csv) if args.csv else synthetic.generate(args.rows)
+    df = data.clean(df.drop_duplicates())
+    X = Encoder(MODEL_COLUMNS).transform(df)
+    y = (df[TARGET] == 'Yes').to_numpy(dtype=np.int8)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    scaler = StandardScaler().fit(X_train)
+    X_train, X_test = scaler.transform(X_train), scaler.transform(X_test)
+
+    start = time.perf_counter()
+    refits = [fit_and_score('tree', {'max_depth': d}, X_train, y_train, X_test, y_test) for d in DEPTHS]
+    refits += [fit_and_score('tree', {'ccp_alpha': a}, X_train, y_train, X_test, y_test) for a in args.alphas]
+    refit_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = TreeSweep().fit(X_train, y_train).sweep(X_train, y_train, X_test, y_test, ccp_alphas=args.alphas)
+    sweep_time = time.perf_counter() - start
+
+    for refit, result in zip(refits, results):
+        print(f"{str(result['params']):<24} leaves {result['n_leaves']:>7}  train {result['train_auc']:.4f}  "
+              f"test {result['test_auc']:.4f}  (refit test {refit['test_auc']:.4f})")
+    print(f"refit {refit_time:.1f} s, sweep {sweep_time:.1f} s, speed-up {refit_time / sweep_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from cvd import data, synthetic
+from cvd.encoding import MODEL_COLUMNS, TARGET, Encoder
+
+
+@pytest.fixture(scope='session')
+def encoded():
+    """Encoded synthetic rows split 80/20, with a scaler fitted on the training array."""
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import StandardScaler
+
+    df = data.clean(synthetic.generate(6000, seed=0))
+    encoder = Encoder(MODEL_COLUMNS)
+    X = encoder.transform(df)
+    y = (df[TARGET] == 'Yes').to_numpy(dtype=np.int8)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    scaler = StandardScaler().fit(X_train)
+    return {'encoder': encoder, 'scaler': scaler, 'X_train': X_train, 'X_test': X_test, 'y_train': y_train,
+            'y_test': y_test}
+
+
+def with_missing(X, fraction=0.05, seed=0):
+    """A copy of X with `fraction` of the values of its first three columns set to NaN."""
+    X = X.copy()
+    mask = np.random.default_rng(seed).random((len(X), 3)) < fraction
+    X[:, :3][mask] = np.nan
+    return X
@@ -0,0 +1,57 @@
+import importlib.util
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cvd import census
+
+
+@pytest.fixture
+def census_csv(tmp_path):
+    ages = np.r_[np.arange(101), 999]
+    rng = np.random.default_rng(0)
+    by_sex = {sex: rng.integers(100000, 3000000, len(ages)) for sex in (1, 2)}
+    rows = [{'SEX': sex, 'AGE': age, census.POPULATION_COLUMN: int(population[i])}
+            for sex, population in by_sex.items() for i, age in enumerate(ages)]
+    rows += [{'SEX': 0, 'AGE': age, census.POPULATION_COLUMN: int(by_sex[1][i] + by_sex[2][i])}
+             for i, age in enumerate(ages)]
+    path = tmp_path / 'nc-est2022-agesex-res.csv'
+    pd.DataFrame(rows).to_csv(path, index=False)
+    return path
+
+
+def _load(path):
+    spec = importlib.util.spec_from_file_location('census_copy', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_rebuild_rewrites_the_embedded_table(census_csv, tmp_path):
+    path = tmp_path / 'census.py'
+    shutil.copy(census.__file__, path)
+    block = census.rebuild(str(census_csv), str(path))
+    rebuilt = _load(path)
+
+    census_df = pd.read_csv(census_csv).query('SEX == 0 and AGE < 999')
+    expected = {label: int(census_df[census_df['AGE'].between(low + 1, high)][census.POPULATION_COLUMN].sum())
+                for label, low, high in zip(list(census.AGE_BIN_MIDPOINTS) + ['80+'], census.AGE_BINS[1:-1],
+                                            census.AGE_BINS[2:])}
+    assert rebuilt.AGE_BIN_TOTALS == expected
+    assert rebuilt.MEAN_AGE_80PLUS == census.mean_age_80plus(census_df)
+    assert rebuilt.AGE_BIN_TOTALS_SOURCE.startswith(census.VERSION)
+    assert max(map(len, block.splitlines())) <= 120
+    # Rebuilding again from the same file changes nothing.
+    before = path.read_text()
+    census.rebuild(str(census_csv), str(path))
+    assert path.read_text() == before
+
+
+def test_generated_block_matches_the_module_layout():
+    block = census._generated(census.AGE_BIN_TOTALS, census.MEAN_AGE_80PLUS, 'x')
+    with open(census.__file__) as f:
+        code = f.read()
+    table = block[block.index('AGE_BIN_TOTALS = '):]
+    assert table in code
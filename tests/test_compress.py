@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from cvd.compress import CompactForest, report
+
+
+@pytest.fixture(scope='module', params=[3, 8, None])
+def forest(request, encoded):
+    return RandomForestClassifier(n_estimators=20, max_depth=request.param, min_samples_leaf=3,
+                                  random_state=0).fit(encoded['X_train'], encoded['y_train'])
+
+
+def test_compact_forest_matches_predict_proba(encoded, forest):
+    compact = CompactForest.from_forest(forest)
+    X = encoded['X_test']
+    np.testing.assert_allclose(compact.predict_proba(X), forest.predict_proba(X)[:, 1], atol=1e-6)
+    assert compact.n_trees == 20
+    assert compact.n_nodes <= sum(estimator.tree_.node_count for estimator in forest.estimators_)
+    assert report(forest, compact, X)['max_abs_diff'] < 1e-6
+
+
+def test_values_between_thresholds_and_unseen_ranges(encoded, forest):
+    compact = CompactForest.from_forest(forest)
+    rng = np.random.default_rng(0)
+    X = encoded['X_test'].astype(np.float64)
+    X = X + rng.normal(0, 0.5, X.shape) * X.std(axis=0)
+    X[:10] *= 100
+    np.testing.assert_allclose(compact.predict_proba(X), forest.predict_proba(X)[:, 1], atol=1e-6)
+
+
+def test_tolerance_bounds_the_difference(encoded, forest):
+    X = encoded['X_test']
+    compact = CompactForest.from_forest(forest, tolerance=0.01)
+    assert compact.n_nodes <= CompactForest.from_forest(forest).n_nodes
+    assert np.abs(compact.predict_proba(X) - forest.predict_proba(X)[:, 1]).max() <= 0.01 + 1e-6
+
+
+def test_select_and_distill(encoded, forest):
+    compact = CompactForest.from_forest(forest)
+    X = encoded['X_test']
+    trees = [1, 4, 7]
+    expected = np.mean([forest.estimators_[t].predict_proba(X)[:, 1] for t in trees], axis=0)
+    np.testing.assert_allclose(compact.select(trees).predict_proba(X), expected, atol=1e-6)
+    np.testing.assert_allclose(compact.distill(X[:500], 20).predict_proba(X), compact.predict_proba(X), atol=1e-6)
+    assert compact.distill(X[:500], 5).n_trees == 5
+    with pytest.raises(ValueError):
+        compact.distill(X[:500], 21)
+
+
+def test_npz_round_trip(encoded, forest, tmp_path):
+    compact = CompactForest.from_forest(forest, tolerance=0.001)
+    path = tmp_path / 'forest.npz'
+    compact.save(path)
+    loaded = CompactForest.load(path)
+    for name in ('feature', 'threshold', 'right', 'value', 'roots', 'edges', 'edge_offsets'):
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(compact, name))
+        assert getattr(loaded, name).dtype == getattr(compact, name).dtype
+    assert loaded.depth == compact.depth and loaded.nbytes == compact.nbytes
+    np.testing.assert_array_equal(loaded.predict_proba(encoded['X_test']), compact.predict_proba(encoded['X_test']))
+
+
+def test_rejects_missing_values_and_other_classes(encoded):
+    X, y = encoded['X_train'][:500], encoded['y_train'][:500]
+    compact = CompactForest.from_forest(RandomForestClassifier(n_estimators=2, random_state=0).fit(X, y))
+    with pytest.raises(ValueError, match='missing'):
+        compact.predict_proba(np.where(np.arange(X.shape[1]) == 0, np.nan, X))
+    three = RandomForestClassifier(n_estimators=2, random_state=0).fit(X, np.arange(len(y)) % 3)
+    with pytest.raises(ValueError, match='binary'):
+        CompactForest.from_forest(three)
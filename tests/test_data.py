@@ -0,0 +1,22 @@
+import os
+
+from cvd import data, synthetic
+
+
+def test_load_cvd_rebuilds_for_another_source(tmp_path):
+    a, b, cache_dir = tmp_path / 'a.csv', tmp_path / 'b.csv', str(tmp_path / 'cache')
+    synthetic.write_csv(a, 2000, seed=0)
+    synthetic.write_csv(b, 500, seed=1)
+    data.build_cache(str(a), cache_dir)
+    assert len(data.load_cvd(str(b), cache_dir)) == 500
+    assert data.read_manifest(cache_dir)['source'] == str(b)
+
+
+def test_load_cvd_rebuilds_when_the_source_file_changes(tmp_path):
+    path, cache_dir = tmp_path / 'a.csv', str(tmp_path / 'cache')
+    synthetic.write_csv(path, 2000, seed=0)
+    assert len(data.load_cvd(str(path), cache_dir)) == 2000
+    synthetic.write_csv(path, 300, seed=1)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert len(data.load_cvd(str(path), cache_dir)) == 300
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+from cvd import dedupe, synthetic
+from cvd.dedupe import Deduplicator
+
+
+def _with_repeats(n, seed):
+    df = synthetic.generate(n, seed=seed)
+    df.loc[df.index[::7], 'BMI'] = np.nan
+    repeats = df.sample(n // 3, replace=True, random_state=seed)
+    return pd.concat([df, repeats]).sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def test_drop_duplicates_matches_pandas():
+    df = _with_repeats(3000, seed=0)
+    expected = df.drop_duplicates()
+    assert len(expected) < len(df)
+    pd.testing.assert_frame_equal(dedupe.drop_duplicates(df), expected)
+    np.testing.assert_array_equal(Deduplicator().duplicated(df), df.duplicated().to_numpy())
+
+
+def test_normalized_types_hash_the_same():
+    df = synthetic.generate(500, seed=1)
+    df['Alcohol_Consumption'] = df['Alcohol_Consumption'].round()
+    other = df[df.columns[::-1]].astype({'Sex': object, 'Exercise': str, 'Alcohol_Consumption': np.int64})
+    np.testing.assert_array_equal(dedupe.row_hashes(df), dedupe.row_hashes(other))
+    assert Deduplicator().filter(pd.concat([df, df[df.columns[::-1]]])).shape == df.shape
+
+
+def test_stream_matches_pandas_across_files_and_runs(tmp_path):
+    a, b = _with_repeats(2000, seed=2), _with_repeats(1000, seed=3)
+    b = pd.concat([b, a.iloc[:300]], ignore_index=True)
+    paths = [str(tmp_path / 'a.csv'), str(tmp_path / 'b.csv')]
+    a.to_csv(paths[0], index=False)
+    b.to_csv(paths[1], index=False)
+    everything = pd.concat([pd.read_csv(path) for path in paths], ignore_index=True)
+
+    state = str(tmp_path / 'state')
+    first = Deduplicator(state)
+    kept = pd.concat([chunk for _, chunk in first.stream(paths[:1], chunksize=700)])
+    first.save()
+    second = Deduplicator(state)
+    kept = pd.concat([kept] + [chunk for _, chunk in second.stream(paths[1:], chunksize=700)], ignore_index=True)
+
+    expected = everything.drop_duplicates()
+    assert len(kept) == len(expected) == len(second)
+    pd.testing.assert_frame_equal(kept.astype(str), expected.reset_index(drop=True).astype(str))
+    counts = second.sources
+    assert counts[paths[0]]['rows'] == len(a) and counts[paths[1]]['rows'] == len(b)
+    assert counts[paths[0]]['kept'] + counts[paths[1]]['kept'] == len(expected)
+    assert counts[paths[0]]['kept'] == len(a.drop_duplicates())
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+import xgboost as xgb
+from sklearn.linear_model import LogisticRegression
+
+from cvd.explain import Explainer
+from conftest import with_missing
+
+
+@pytest.mark.parametrize('max_depth', [1, 3, 6])
+@pytest.mark.parametrize('missing', [False, True])
+def test_tables_match_pred_contribs(encoded, max_depth, missing):
+    X_train, X_test = encoded['X_train'], encoded['X_test']
+    if missing:
+        X_train, X_test = with_missing(X_train), with_missing(X_test, seed=1)
+    clf = xgb.XGBClassifier(n_estimators=20, max_depth=max_depth).fit(X_train, encoded['y_train'])
+    contribs = Explainer(clf, X_test.shape[1], method='tables').contributions(X_test)
+    expected = clf.get_booster().predict(xgb.DMatrix(X_test), pred_contribs=True)
+    np.testing.assert_allclose(contribs, expected, atol=1e-5)
+
+
+def test_tables_honour_best_iteration(encoded):
+    X_train, y_train = encoded['X_train'], encoded['y_train']
+    clf = xgb.XGBClassifier(n_estimators=200, max_depth=3, eta=0.3, early_stopping_rounds=5)
+    clf.fit(X_train, y_train, eval_set=[(encoded['X_test'], encoded['y_test'])], verbose=False)
+    assert clf.best_iteration < 199
+    contribs = Explainer(clf, X_train.shape[1], method='tables').contributions(encoded['X_test'])
+    margin = clf.predict(encoded['X_test'], output_margin=True)
+    np.testing.assert_allclose(contribs.sum(axis=1), margin, atol=1e-4)
+
+
+def test_deep_boosters_fall_back_to_native(encoded):
+    clf = xgb.XGBClassifier(n_estimators=5, max_depth=8).fit(encoded['X_train'], encoded['y_train'])
+    explainer = Explainer(clf, encoded['X_train'].shape[1])
+    assert explainer.method == 'native'
+    with pytest.raises(ValueError):
+        Explainer(clf, encoded['X_train'].shape[1], method='tables')
+
+
+def test_linear_contributions_sum_to_the_log_odds(encoded):
+    X_train, X_test = encoded['scaler'].transform(encoded['X_train']), encoded['scaler'].transform(encoded['X_test'])
+    clf = LogisticRegression().fit(X_train, encoded['y_train'])
+    contribs = Explainer(clf, X_test.shape[1]).contributions(X_test)
+    np.testing.assert_allclose(contribs.sum(axis=1), clf.decision_function(X_test), atol=1e-4)
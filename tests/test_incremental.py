@@ -0,0 +1,36 @@
+import warnings
+
+import numpy as np
+import pytest
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import StandardScaler
+
+from cvd import synthetic
+from cvd.incremental import IncrementalModel
+from cvd.serve import export_model
+
+
+@pytest.mark.parametrize('frame', [False, True], ids=['array-scaler', 'frame-scaler'])
+@pytest.mark.parametrize('model', ['logreg', 'xgb'])
+def test_update_refreshes_either_kind_of_artifact(encoded, tmp_path, frame, model):
+    import xgboost as xgb
+
+    encoder, X, y = encoded['encoder'], encoded['X_train'], encoded['y_train']
+    # `cvd.pipeline` fits the scaler on an array, `cvd.streaming` on the encoder's DataFrame.
+    scaler = StandardScaler().fit(encoder.to_frame(X) if frame else X)
+    Z = scaler.transform(encoder.to_frame(X) if frame else X)
+    estimator = LogisticRegression(solver='saga', max_iter=200) if model == 'logreg' else \
+        xgb.XGBClassifier(n_estimators=10, max_depth=3, random_state=0)
+    estimator.fit(Z, y)
+    path = str(tmp_path / 'model.joblib')
+    export_model(path, encoder, scaler, estimator)
+
+    wave = synthetic.generate(2000, seed=1)
+    incremental = IncrementalModel.load(path)
+    with warnings.catch_warnings():
+        warnings.filterwarnings('error', message='.*feature names')
+        report = incremental.update(wave, rounds=2, max_iter=5)
+        proba = incremental.predict_proba(wave.head(50))
+    assert report['rows_seen'] == len(X) + report['update_rows']
+    assert hasattr(incremental.running_scaler, 'feature_names_in_') == frame
+    assert np.all((proba >= 0) & (proba <= 1))
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from sklearn import metrics as sk_metrics
+
+from cvd import metrics
+
+
+def _labels_and_scores(seed, n=2000, ties=False):
+    rng = np.random.default_rng(seed)
+    y = (rng.random(n) < 0.1).astype(np.int8)
+    scores = rng.random(n) + 0.3 * y
+    if ties:
+        scores = np.round(scores, 1)
+    return y, scores
+
+
+@pytest.mark.parametrize('ties', [False, True])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_auroc_and_average_precision_match_sklearn(seed, ties):
+    y, scores = _labels_and_scores(seed, ties=ties)
+    assert metrics.auroc(y, scores) == pytest.approx(sk_metrics.roc_auc_score(y, scores), abs=1e-12)
+    assert metrics.average_precision(y, scores) == pytest.approx(sk_metrics.average_precision_score(y, scores),
+                                                                 abs=1e-12)
+    result = metrics.evaluate(y, scores)
+    assert result['auc'] == pytest.approx(sk_metrics.roc_auc_score(y, scores), abs=1e-12)
+    assert result['average_precision'] == pytest.approx(sk_metrics.average_precision_score(y, scores), abs=1e-12)
+
+
+def test_roc_curve_matches_sklearn():
+    y, scores = _labels_and_scores(3, ties=True)
+    result = metrics.evaluate(y, scores)
+    fpr, tpr, _ = sk_metrics.roc_curve(y, scores, drop_intermediate=False)
+    np.testing.assert_allclose(result['fpr'], fpr)
+    np.testing.assert_allclose(result['tpr'], tpr)
+
+
+def test_confusion_matrices_match_predictions_above_threshold():
+    y, scores = _labels_and_scores(4, ties=True)
+    result = metrics.evaluate(y, scores, thresholds=[0.2, 0.5, 0.8])
+    for i, threshold in enumerate([0.2, 0.5, 0.8]):
+        predicted = (scores > threshold).astype(int)
+        np.testing.assert_array_equal(metrics.confusion_matrix(result, i), sk_metrics.confusion_matrix(y, predicted))
+        assert result['at'][i]['f1'] == pytest.approx(sk_metrics.f1_score(y, predicted))
+        assert result['at'][i]['precision'] == pytest.approx(sk_metrics.precision_score(y, predicted))
@@ -0,0 +1,47 @@
+import warnings
+
+import numpy as np
+import pytest
+from sklearn.linear_model import LogisticRegression
+
+from cvd.regpath import logreg_path, model_from_result
+
+
+@pytest.fixture(scope='module')
+def path(encoded):
+    # float64, as saga solves float32 inputs in single precision.
+    X_train, X_test = (encoded['scaler'].transform(encoded[key]).astype(np.float64) for key in ('X_train', 'X_test'))
+    return logreg_path(X_train, encoded['y_train'], X_test, encoded['y_test'], Cs=[0.01, 1, 100], verbose=False), \
+        X_train, X_test
+
+
+def test_path_matches_saga_at_every_point(encoded, path):
+    path, X_train, _ = path
+    for result in path['results']:
+        penalty, C = result['params']['penalty'], result['params']['C']
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            saga = LogisticRegression(solver='saga', penalty=penalty, C=C,
+                                      l1_ratio=0.5 if penalty == 'elasticnet' else None, tol=1e-8,
+                                      max_iter=10000).fit(X_train, encoded['y_train'])
+        np.testing.assert_allclose(result['coef'], saga.coef_[0], atol=1e-6)
+        assert result['intercept'] == pytest.approx(saga.intercept_[0], abs=1e-6)
+
+
+def test_path_model_predicts_with_the_best_point(encoded, path):
+    path, _, X_test = path
+    model = model_from_result(path['best'])
+    assert path['best']['test_auc'] == max(result['test_auc'] for result in path['results'])
+    logits = X_test @ np.asarray(path['best']['coef']) + path['best']['intercept']
+    np.testing.assert_allclose(path['model'].predict_proba(X_test)[:, 1], 1 / (1 + np.exp(-logits)), atol=1e-12)
+    np.testing.assert_allclose(model.decision_function(X_test), logits, atol=1e-12)
+    assert path['coefs'].shape == (3, 3, X_test.shape[1])
+
+
+def test_path_is_cached(encoded, path, tmp_path):
+    _, X_train, X_test = path
+    args = (X_train, encoded['y_train'], X_test, encoded['y_test'])
+    first = logreg_path(*args, Cs=[0.1, 1], penalties=('l1',), cache_dir=tmp_path, verbose=False)
+    second = logreg_path(*args, Cs=[0.1, 1], penalties=('l1',), cache_dir=tmp_path, verbose=False)
+    assert not any(r['cached'] for r in first['results']) and all(r['cached'] for r in second['results'])
+    np.testing.assert_array_equal(first['coefs'], second['coefs'])
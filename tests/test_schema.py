@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cvd import synthetic
+from cvd.schema import RULES, Validator
+
+
+@pytest.fixture
+def survey():
+    df = synthetic.generate(1000, seed=0)
+    df = df[df['Diabetes'].isin(['Yes', 'No'])].reset_index(drop=True)
+    df['Diabetes'] = df['Diabetes'].astype(object)
+    df['Age_Category'] = df['Age_Category'].astype(object)
+    df.loc[3, 'Diabetes'] = 'No, pre-diabetes or borderline diabetes'
+    df.loc[5, 'BMI'] = np.nan
+    df.loc[5, 'Height_(cm)'] = 300
+    df.loc[8, 'Age_Category'] = None
+    df.loc[13, 'Alcohol_Consumption'] = -1
+    return df
+
+
+def test_counters_and_quarantine_rows(survey, tmp_path):
+    quarantine = tmp_path / 'quarantine.csv'
+    validator = Validator(quarantine=str(quarantine))
+    valid = pd.concat([validator.validate(survey.iloc[:500], 'a.csv'), validator.validate(survey.iloc[500:], 'a.csv')])
+
+    n = len(survey)
+    assert list(valid.index) == [i for i in range(n) if i not in (3, 5, 8, 13)]
+    nonzero = {name: count for name, count in validator.counts.items() if count}
+    assert nonzero == {'rows': n, 'valid': n - 4, 'quarantined': 4, 'Diabetes:categories': 1, 'BMI:null': 1,
+                       'Height_(cm):range': 1, 'Age_Category:null': 1, 'Alcohol_Consumption:range': 1}
+    rows = pd.read_csv(quarantine)
+    assert list(rows.columns) == ['source', 'row', 'reasons'] + list(survey.columns)
+    assert list(rows['row']) == [3, 5, 8, 13] and set(rows['source']) == {'a.csv'}
+    assert list(rows['reasons']) == [
+        "Diabetes not one of ['No', 'Yes']",
+        'Height_(cm) outside [91, 241]; BMI missing',
+        'Age_Category missing',
+        'Alcohol_Consumption outside [0, 30]',
+    ]
+    assert rows.loc[0, 'Diabetes'] == survey.loc[3, 'Diabetes']
+
+
+def test_quarantine_is_rewritten_by_a_clean_run(survey, tmp_path):
+    quarantine = tmp_path / 'quarantine.csv'
+    Validator(quarantine=str(quarantine)).validate(survey, 'old.csv')
+    validator = Validator(quarantine=str(quarantine))
+    clean = validator.validate(survey.drop(index=[3, 5, 8, 13]), 'new.csv')
+    validator.validate(clean, 'new.csv')
+    rows = pd.read_csv(quarantine)
+    assert rows.empty and list(rows.columns) == ['source', 'row', 'reasons'] + list(survey.columns)
+    assert validator.counts['quarantined'] == 0 and validator.counts['valid'] == 2 * len(clean)
+
+
+def test_missing_columns_raise(survey):
+    with pytest.raises(ValueError, match='BMI'):
+        Validator().validate(survey.drop(columns='BMI'))
+    assert len(Validator(rules={'BMI': RULES['BMI']}).validate(survey[['BMI']])) == len(survey) - 1
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+import xgboost as xgb
+from sklearn.linear_model import LogisticRegression
+
+from cvd.scorer import Scorer, export_scorer
+from conftest import with_missing
+
+
+@pytest.mark.parametrize('max_depth', [1, 3, 6, 8])
+@pytest.mark.parametrize('missing', [False, True])
+def test_tree_scorer_matches_predict_proba(encoded, tmp_path, max_depth, missing):
+    X_train, X_test = encoded['X_train'], encoded['X_test']
+    if missing:
+        X_train, X_test = with_missing(X_train), with_missing(X_test, seed=1)
+    scaler = encoded['scaler']
+    clf = xgb.XGBClassifier(n_estimators=30, max_depth=max_depth, eta=0.3).fit(scaler.transform(X_train),
+                                                                               encoded['y_train'])
+    export_scorer(tmp_path / 'model.npz', encoded['encoder'], scaler, clf)
+    expected = clf.predict_proba(scaler.transform(X_test))[:, 1]
+    np.testing.assert_allclose(Scorer.load(tmp_path / 'model.npz').predict_proba(X_test), expected, atol=1e-6)
+
+
+def test_linear_scorer_matches_predict_proba(encoded, tmp_path):
+    scaler = encoded['scaler']
+    clf = LogisticRegression().fit(scaler.transform(encoded['X_train']), encoded['y_train'])
+    export_scorer(tmp_path / 'model.npz', encoded['encoder'], scaler, clf)
+    expected = clf.predict_proba(scaler.transform(encoded['X_test']))[:, 1]
+    np.testing.assert_allclose(Scorer.load(tmp_path / 'model.npz').predict_proba(encoded['X_test']), expected,
+                               atol=1e-6)
+
+
+def test_scorer_encodes_records(encoded, tmp_path):
+    from cvd import data, synthetic
+
+    df = data.clean(synthetic.generate(200, seed=3))
+    scaler = encoded['scaler']
+    clf = xgb.XGBClassifier(n_estimators=10, max_depth=3).fit(scaler.transform(encoded['X_train']),
+                                                              encoded['y_train'])
+    export_scorer(tmp_path / 'model.npz', encoded['encoder'], scaler, clf)
+    scorer = Scorer.load(tmp_path / 'model.npz')
+    records = df.astype(object).to_dict('records')
+    np.testing.assert_allclose(scorer.predict_proba(records),
+                               scorer.predict_proba(encoded['encoder'].transform(df)), atol=1e-7)
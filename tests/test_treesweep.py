@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from sklearn.tree import DecisionTreeClassifier
+
+from cvd.treesweep import TreeSweep
+
+
+@pytest.fixture(scope='module')
+def sweep(encoded):
+    return TreeSweep(random_state=0, min_samples_leaf=5).fit(encoded['X_train'], encoded['y_train'])
+
+
+def _alphas(encoded):
+    path = DecisionTreeClassifier(random_state=0, min_samples_leaf=5).cost_complexity_pruning_path(
+        encoded['X_train'], encoded['y_train'])
+    # Midpoints between the effective alphas, so no comparison sits on a tie.
+    alphas = (path.ccp_alphas[1:] + path.ccp_alphas[:-1]) / 2
+    return alphas[np.linspace(0, len(alphas) - 1, 6).astype(int)]
+
+
+def test_pruning_matches_ccp_alpha_refits(encoded, sweep):
+    for alpha in _alphas(encoded):
+        refit = sweep.refit(encoded['X_train'], encoded['y_train'], ccp_alpha=alpha)
+        np.testing.assert_allclose(sweep.predict_proba(encoded['X_test'], ccp_alpha=alpha),
+                                   refit.predict_proba(encoded['X_test'])[:, 1], atol=1e-12)
+        assert sweep.n_leaves(ccp_alpha=alpha) == refit.get_n_leaves()
+        np.testing.assert_allclose(sweep.feature_importances(ccp_alpha=alpha), refit.feature_importances_,
+                                   atol=1e-12)
+
+
+def test_depth_limit_matches_the_refit_impurity(encoded, sweep):
+    X, y = encoded['X_train'], encoded['y_train']
+    for depth in (1, 3, 5, 8):
+        refit = sweep.refit(X, y, max_depth=depth)
+        assert refit.get_depth() == depth
+        p, q = sweep.predict_proba(X, max_depth=depth), refit.predict_proba(X)[:, 1]
+        gini = [np.mean(2 * r * (1 - r)) for r in (p, q)]
+        assert gini[0] == pytest.approx(gini[1], rel=1e-9)
+
+
+def test_sweep_reports_every_setting(encoded, sweep):
+    results = sweep.sweep(encoded['X_train'], encoded['y_train'], encoded['X_test'], encoded['y_test'],
+                          depths=(1, None), ccp_alphas=[1e-3])
+    assert [r['params'] for r in results] == [{'max_depth': 1}, {'max_depth': None}, {'ccp_alpha': 1e-3}]
+    assert results[0]['n_leaves'] == 2 and results[1]['n_leaves'] == sweep.estimator_.get_n_leaves()
+    assert results[1]['train_auc'] > results[0]['train_auc']